@@ -1,931 +1,897 @@
 import asyncio
+import contextvars
+import functools
 import logging
+import sys
+from datetime import datetime
 from typing import Optional
 from pyrogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from pyrogram.errors import FloodWait
-from utils import validate_phone_number, parse_message_range, format_speed, format_time
+from utils import validate_phone_number, parse_message_range, format_speed, format_time, RateLimiter, answer_in_background
+from config import BOT_API_RATE_LIMIT, CHAT_RATE_LIMIT, CHAT_RATE_PERIOD, MAX_RETRIES
 
 logger = logging.getLogger(__name__)
 
+# Callback data
+CB_MAIN_MENU = sys.intern("main_menu")
+CB_CREATE_SESSION = sys.intern("create_session")
+CB_SESSION_PHONE = sys.intern("session_phone")
+CB_SESSION_STRING = sys.intern("session_string")
+CB_VIEW_SESSION = sys.intern("view_session")
+CB_DELETE_SESSION = sys.intern("delete_session")
+CB_SET_SOURCE = sys.intern("set_source")
+CB_SET_TARGET = sys.intern("set_target")
+CB_SET_RANGE = sys.intern("set_range")
+CB_START_COPY = sys.intern("start_copy")
+CB_VIEW_STATS = sys.intern("view_stats")
+CB_UPGRADE_VIP = sys.intern("upgrade_vip")
+CB_VIP_BENEFITS = sys.intern("vip_benefits")
+CB_PAYMENT_METHODS = sys.intern("payment_methods")
+CB_PERSONAL_COPY = sys.intern("personal_copy")
+CB_HOW_TO_USE = sys.intern("how_to_use")
+CB_HOW_TO_USE_AR = sys.intern("how_to_use_ar")
+CB_ADMIN_PANEL = sys.intern("admin_panel")
+CB_PROMOTE_VIP = sys.intern("promote_vip")
+CB_DEMOTE_VIP = sys.intern("demote_vip")
+CB_SET_FREE_LIMIT = sys.intern("set_free_limit")
+CB_BROADCAST = sys.intern("broadcast")
+CB_USER_STATS = sys.intern("user_stats")
+CB_RESET_USER_LIMIT = sys.intern("reset_user_limit")
+
+# Callbacks only the owner may trigger
+_OWNER_ACTIONS = frozenset({
+    CB_ADMIN_PANEL, CB_PROMOTE_VIP, CB_DEMOTE_VIP, CB_SET_FREE_LIMIT,
+    CB_BROADCAST, CB_USER_STATS, CB_RESET_USER_LIMIT,
+})
+
+# Per-callback memo of session/client/stats lookups, set for the duration of handle_callback
+_request_cache = contextvars.ContextVar("request_cache", default=None)
+
+class _StaticKeyboardMarkup(InlineKeyboardMarkup):
+    """Keyboard whose raw Telegram form is built once and reused on every send.
+
+    Only safe for callback-data buttons, which don't depend on the client."""
+
+    async def write(self, client):
+        raw_markup = getattr(self, "_raw", None)
+        if raw_markup is None:
+            raw_markup = self._raw = await super().write(client)
+        return raw_markup
+
+# Shared button rows, reused by every keyboard that shows them
+_ROW_BACK_MAIN = [InlineKeyboardButton("🔙 Back", callback_data=CB_MAIN_MENU)]
+_ROW_BACK_CREATE_SESSION = [InlineKeyboardButton("🔙 Back", callback_data=CB_CREATE_SESSION)]
+_ROW_BACK_ADMIN = [InlineKeyboardButton("🔙 Back", callback_data=CB_ADMIN_PANEL)]
+_ROW_BACK_UPGRADE_VIP = [InlineKeyboardButton("🔙 Back", callback_data=CB_UPGRADE_VIP)]
+_ROW_MAIN_MENU = [InlineKeyboardButton("🔙 Main Menu", callback_data=CB_MAIN_MENU)]
+_ROW_PAYMENT_METHODS = [InlineKeyboardButton("💳 Payment Methods", callback_data=CB_PAYMENT_METHODS)]
+
+# Static keyboards
+_BACK_MAIN_MARKUP = _StaticKeyboardMarkup([_ROW_BACK_MAIN])
+_BACK_CREATE_SESSION_MARKUP = _StaticKeyboardMarkup([_ROW_BACK_CREATE_SESSION])
+_BACK_ADMIN_MARKUP = _StaticKeyboardMarkup([_ROW_BACK_ADMIN])
+_BACK_UPGRADE_VIP_MARKUP = _StaticKeyboardMarkup([_ROW_BACK_UPGRADE_VIP])
+
+_SESSION_INFO_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("🗑 Delete Session", callback_data=CB_DELETE_SESSION)],
+    _ROW_BACK_MAIN
+])
+
+_SESSION_DELETED_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("🔑 Create New Session", callback_data=CB_CREATE_SESSION)],
+    _ROW_MAIN_MENU
+])
+
+_VIP_UPGRADE_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("💎 VIP Benefits", callback_data=CB_VIP_BENEFITS)],
+    _ROW_PAYMENT_METHODS,
+    _ROW_BACK_MAIN,
+])
+
+_VIP_BENEFITS_MARKUP = _StaticKeyboardMarkup([
+    _ROW_PAYMENT_METHODS,
+    _ROW_BACK_UPGRADE_VIP,
+])
+
+_HOW_TO_USE_EN_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("🇦🇪 العربية", callback_data=CB_HOW_TO_USE_AR)],
+    _ROW_BACK_MAIN
+])
+
+_HOW_TO_USE_AR_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("🇬🇧 English", callback_data=CB_HOW_TO_USE)],
+    _ROW_BACK_MAIN
+])
+
+_SESSION_CREATION_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("📱 Phone Number", callback_data=CB_SESSION_PHONE)],
+    [InlineKeyboardButton("📄 Session String", callback_data=CB_SESSION_STRING)],
+    _ROW_BACK_MAIN
+])
+
+_ADMIN_PANEL_MARKUP = _StaticKeyboardMarkup([
+    [InlineKeyboardButton("⭐ Promote to VIP", callback_data=CB_PROMOTE_VIP)],
+    [InlineKeyboardButton("❌ Remove VIP", callback_data=CB_DEMOTE_VIP)],
+    [InlineKeyboardButton("✏️ Set Free User Limit", callback_data=CB_SET_FREE_LIMIT)],
+    [InlineKeyboardButton("📢 Broadcast", callback_data=CB_BROADCAST)],
+    [InlineKeyboardButton("📊 User Stats", callback_data=CB_USER_STATS)],
+    [InlineKeyboardButton("🔄 Reset User Limit", callback_data=CB_RESET_USER_LIMIT)],
+    _ROW_BACK_MAIN
+])
+
+# Main menu rows
+_ROW_HOW_TO_USE = [InlineKeyboardButton("📖 How to Use", callback_data=CB_HOW_TO_USE)]
+_ROW_VIEW_SESSION = [InlineKeyboardButton("🔍 View Session", callback_data=CB_VIEW_SESSION)]
+_ROW_DELETE_SESSION = [InlineKeyboardButton("🗑 Delete Session", callback_data=CB_DELETE_SESSION)]
+_ROW_CREATE_SESSION = [InlineKeyboardButton("🔑 Create Session", callback_data=CB_CREATE_SESSION)]
+_ROW_SET_CHANNELS = [
+    InlineKeyboardButton("📥 Set Source", callback_data=CB_SET_SOURCE),
+    InlineKeyboardButton("📤 Set Target", callback_data=CB_SET_TARGET)
+]
+_ROW_SET_RANGE = [InlineKeyboardButton("📊 Set Range", callback_data=CB_SET_RANGE)]
+_ROW_START_COPY = [InlineKeyboardButton("🚀 Start Copying", callback_data=CB_START_COPY)]
+_ROW_STATS_VIP = [
+    InlineKeyboardButton("📈 My Stats", callback_data=CB_VIEW_STATS),
+    InlineKeyboardButton("⭐ Upgrade VIP", callback_data=CB_UPGRADE_VIP)
+]
+_ROW_PERSONAL_COPY = [InlineKeyboardButton("📩 Copy Message(s) to Me", callback_data=CB_PERSONAL_COPY)]
+_ROW_ADMIN_PANEL = [InlineKeyboardButton("⚙️ Admin Panel", callback_data=CB_ADMIN_PANEL)]
+
+_ROWS_WITH_SESSION = [_ROW_VIEW_SESSION, _ROW_DELETE_SESSION, _ROW_SET_CHANNELS, _ROW_SET_RANGE]
+_ROWS_FOOTER = [_ROW_STATS_VIP, _ROW_PERSONAL_COPY]
+
+def _build_main_menu_markup(has_session: bool, can_copy: bool, is_owner: bool) -> _StaticKeyboardMarkup:
+    keyboard = [_ROW_HOW_TO_USE]
+    if has_session:
+        # Session management and channel setup
+        keyboard += _ROWS_WITH_SESSION
+        # Copy button (only if all settings are configured)
+        if can_copy:
+            keyboard.append(_ROW_START_COPY)
+    else:
+        keyboard.append(_ROW_CREATE_SESSION)
+    keyboard += _ROWS_FOOTER
+    if is_owner:
+        keyboard.append(_ROW_ADMIN_PANEL)
+    return _StaticKeyboardMarkup(keyboard)
+
+# Every main menu variant, keyed by (has_session, can_copy, is_owner); can_copy only matters with a session
+_MAIN_MENU_MARKUPS = {
+    (has_session, can_copy, is_owner): _build_main_menu_markup(has_session, can_copy, is_owner)
+    for has_session in (False, True) for can_copy in (False, True) for is_owner in (False, True)
+}
+
+# Shown when the main menu itself fails to load
+_FALLBACK_MENU_MARKUP = _StaticKeyboardMarkup([_ROW_CREATE_SESSION])
+
+# Session fields read by the main menu, in unpacking order
+_MENU_SESSION_KEYS = ('source_title', 'target_title', 'source_channel', 'target_channel', 'start_msg_id', 'end_msg_id')
+
+# Static texts
+_MAIN_MENU_HEADER = "🤖 **Telegram Save Restricted Content Bot**\n\n"
+_FALLBACK_MENU_TEXT = "🤖 **Telegram Message Copier Bot**\n\n❌ Error loading full menu. Please start by creating a session."
+
+# Account type line of the main menu, filled from user stats
+_ACCOUNT_LINES = {
+    'owner': "👑 **Owner Account**",
+    'vip': "⭐ **VIP Account**",
+    'free': "🆓 **Free Account**\n📨 **Messages Used:** {message_count}/{message_limit}",
+}
+
+_SESSION_CREATION_TEXT = (
+    "🔑 **Create Session**\n\n"
+    "Choose how you want to create your session:\n\n"
+    "📱 **Phone Number:** Use your phone number to create a new session\n"
+    "📄 **Session String:** Import an existing session string"
+)
+
+_PHONE_SESSION_TEXT = (
+    "📱 **Phone Number Session**\n\n"
+    "Please send your phone number in international format.\n"
+    "Example: `+1234567890`\n\n"
+    "⚠️ Make sure to include the country code with the + sign."
+)
+
+_STRING_SESSION_TEXT = (
+    "📄 **Session String Import**\n\n"
+    "Please send your session string.\n\n"
+    "⚠️ **Important:** Never share your session string with others!\n"
+    "Anyone with your session string can access your Telegram account."
+)
+
+_SOURCE_CHANNEL_TEXT = (
+    "📥 **Set Source Channel**\n\n"
+    "Send the source channel information:\n\n"
+    "✅ **Supported formats:**\n"
+    "• Channel username: `@channelname`\n"
+    "• Channel link: `https://t.me/channelname`\n"
+    "• Channel ID: `-1001234567890`\n"
+    "• Invitation link: `https://t.me/+AbCdEfGhIj`\n"
+    "• Message link: `https://t.me/c/123456789/1` or `https://t.me/channelname/1`\n\n"
+    "💡 **For private channels:** Use invitation links or message links for best results"
+)
+
+_TARGET_CHANNEL_TEXT = (
+    "📤 **Set Target Channel**\n\n"
+    "Send the target channel information:\n\n"
+    "✅ **Supported formats:**\n"
+    "• Channel username: `@channelname`\n"
+    "• Channel link: `https://t.me/channelname`\n"
+    "• Channel ID: `-1001234567890`\n"
+    "• **Invitation link: `https://t.me/+AbCdEfGhIj`**\n\n"
+    "⚠️ **Note:** You must be admin in the target channel to copy messages"
+)
+
+_MESSAGE_RANGE_TEXT = (
+    "📊 **Set Message Range**\n\n"
+    "Send the message range you want to copy:\n\n"
+    "**Format:** `start_id-end_id`\n"
+    "**Examples:**\n"
+    "• `1-100` - Copy messages 1 to 100\n"
+    "• `50-150` - Copy messages 50 to 150\n"
+    "• `1000-2000` - Copy messages 1000 to 2000\n\n"
+    "💡 **Tip:** Check the source channel to find the message IDs you want"
+)
+
+_ADMIN_PANEL_TEXT = (
+    "⚙️ **Admin Panel**\n\n"
+    "👑 **Owner Controls:**\n"
+    "• Promote users to VIP\n"
+    "• Remove VIP status\n"
+    "• Change message limit for free users\n"
+    "• Broadcast message to all users\n"
+    "• View user statistics"
+)
+
+_VIP_PROMOTION_TEXT = (
+    "⭐ **Promote to VIP**\n\n"
+    "Send the user ID to promote to VIP status.\n"
+    "Example: `123456789`"
+)
+
+_VIP_DEMOTION_TEXT = (
+    "❌ **Remove VIP Status**\n\n"
+    "Send the user ID to remove VIP status.\n"
+    "Example: `123456789`"
+)
+
+_FREE_LIMIT_TEXT = (
+    "✏️ **Set Free User Message Limit**\n\n"
+    "Send the new daily message limit for free users (number):"
+)
+
+_SESSION_DELETED_TEXT = (
+    "✅ **Session Deleted**\n\n"
+    "Your session has been completely removed.\n"
+    "All stored data (channels, message ranges) has been cleared.\n\n"
+    "You can create a new session anytime."
+)
+
+_BROADCAST_TEXT = (
+    "📢 **Broadcast**\n\n"
+    "Send the message you want to broadcast to all users:"
+)
+
+# "My Stats" page per account type, filled from user stats
+_USER_STATS_FOOTER = (
+    "⚡ **Speed:** {speed_limit:.1f} MB/s\n"
+    "\n💾 **Total Sent:** {message_count}"
+)
+_USER_STATS_PAGES = {
+    'owner': (
+        "📈 **Your Statistics**\n\n"
+        "👑 **Account Type:** Owner\n📨 **Messages:** Unlimited\n"
+        + _USER_STATS_FOOTER
+    ),
+    'vip': (
+        "📈 **Your Statistics**\n\n"
+        "⭐ **Account Type:** VIP\n📨 **Messages:** Unlimited\n"
+        + _USER_STATS_FOOTER
+    ),
+    'free': (
+        "📈 **Your Statistics**\n\n"
+        "🆓 **Account Type:** Free\n"
+        "📨 **Messages Used:** {message_count}/{message_limit}\n"
+        "📨 **Remaining:** {remaining_messages}\n"
+        + _USER_STATS_FOOTER
+    ),
+}
+
+# Admin user totals, filled from UserManager.get_user_counts()
+_USER_STATS_TEXT = (
+    "📊 **User Stats**\n\n"
+    "Total users: {total}\n"
+    "VIPs: {vips}\n"
+    "Owners: {owners}"
+)
+
+_PERSONAL_COPY_TEXT = (
+    "📩 **Copy Messages to Me**\n\n"
+    "Send me a message link or range to copy:\n\n"
+    "✅ **Supported formats:**\n"
+    "• Single message: `https://t.me/c/123456789/1`\n"
+    "• Message range: `https://t.me/c/123456789/1-10`\n"
+    "• Public channel: `https://t.me/channelname/1`\n\n"
+    "💡 **Tips:**\n"
+    "• For private channels, use message links\n"
+    "• You can copy multiple messages by using a range\n"
+    "• Make sure you have access to the messages"
+)
+
+_VIP_UPGRADE_TEXT = (
+    "⭐ <b>Upgrade to VIP</b> ⭐\n\n"
+    "Unlock unlimited messages, faster speed, and premium support!\n\n"
+    "<b>VIP Features:</b>\n"
+    "• Unlimited message copying\n"
+    "• Increased speed\n"
+    "• Priority support\n\n"
+    "To become VIP, see payment methods or contact the admin."
+)
+
+_VIP_BENEFITS_TEXT = (
+    "💎 <b>VIP Benefits</b> 💎\n\n"
+    "• Unlimited message copying\n"
+    "• Increased speed (up to 1 Gb/s)\n"
+    "• No daily limits\n"
+    "• Priority support from the admin\n"
+    "• Early access to new features\n\n"
+    "Ready to upgrade? See payment methods or contact the admin."
+)
+
+_PAYMENT_METHODS_TEXT = (
+    "💳 <b>Payment Methods</b> 💳\n\n"
+    "Lifetime VIP: <b>100 EGP</b> or <b>3$</b>\n\n"
+    "<b>Binance ID 🏦:</b> <code>789564679</code>\n"
+    "USDT (TRC 20) 📱: <code>TE1S4PeEws1xq5QaehdrZFW4fPZYZbYiUu</code>\n"
+    "Vodafone Cash 🔴: <code>01015339426</code>\n"
+    "Instapay 💳: <code>mohamed1573@instapay</code>\n\n"
+    "After payment, send your user ID and payment proof to the admin.\n\n"
+    "<b>Admin:</b> <a href='https://t.me/M7MED1573'>@M7MED1573</a>"
+)
+
+_HOW_TO_USE_EN = (
+    "📖 **How to Use the Bot**\n\n"
+
+    "🤖 **What This Bot Does**\n"
+    "This bot helps you copy messages from one Telegram channel to another. It's perfect for:\n"
+    "• Copying content from private channels to your own channel\n"
+    "• Backing up important messages and media\n"
+    "• Transferring content between channels\n"
+    "• Saving messages with all their media (photos, videos, files, etc.)\n"
+    "• Copying messages directly to your personal chat\n\n"
+
+    "🔑 **1. Create Session**\n"
+    "• Click 'Create Session' in the main menu\n"
+    "• Choose your preferred method:\n"
+    "  - Phone Number: Enter your Telegram phone number\n"
+    "  - Session String: Import an existing session\n"
+    "• Follow the authentication steps:\n"
+    "  - Enter verification code sent to your Telegram\n"
+    "  - Enter 2FA password if enabled\n"
+    "• Wait for session confirmation\n\n"
+
+    "📥 **2. Set Source Channel**\n"
+    "• Click 'Set Source' in the main menu\n"
+    "• Send one of these formats:\n"
+    "  - Channel username: `@channelname`\n"
+    "  - Channel link: `https://t.me/channelname`\n"
+    "  - Channel ID: `-1001234567890`\n"
+    "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
+    "  - Message link: `https://t.me/c/123456789/1`\n"
+    "• For private channels:\n"
+    "  - Use message links for best results\n"
+    "  - Make sure you're a member of the channel\n"
+    "  - Your account must have access to the messages\n\n"
+
+    "📤 **3. Set Target Channel**\n"
+    "• Click 'Set Target' in the main menu\n"
+    "• Send target channel information:\n"
+    "  - Channel username: `@channelname`\n"
+    "  - Channel link: `https://t.me/channelname`\n"
+    "  - Channel ID: `-1001234567890`\n"
+    "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
+    "• Important requirements:\n"
+    "  - You must be an admin in the target channel\n"
+    "  - Your account must have posting permissions\n"
+    "  - Channel must allow message posting\n\n"
+
+    "📊 **4. Set Message Range**\n"
+    "• Click 'Set Range' in the main menu\n"
+    "• Choose from these options:\n"
+    "  - Copy all: Copies entire channel\n"
+    "  - Set start: Specify first message\n"
+    "  - Set end: Specify last message\n"
+    "• Range formats:\n"
+    "  - Single message: `https://t.me/c/123456789/1`\n"
+    "  - Message range: `https://t.me/c/123456789/1-10`\n"
+    "  - ID range: `1-100`\n"
+    "• Tips for range selection:\n"
+    "  - Use message links for precise selection\n"
+    "  - Check message IDs in the source channel\n"
+    "  - Maximum range is 1000 messages\n\n"
+
+    "🚀 **5. Start Copying**\n"
+    "• Click 'Start Copying' when ready\n"
+    "• The bot will show:\n"
+    "  - Total messages to copy\n"
+    "  - Real-time progress\n"
+    "  - Copy speed and time remaining\n"
+    "  - Success/failure count\n"
+    "• During copying:\n"
+    "  - Don't delete the progress message\n"
+    "  - Keep your session active\n"
+    "  - Wait for completion message\n\n"
+
+    "📩 **Quick Copy to Me**\n"
+    "• Click 'Copy Message(s) to Me'\n"
+    "• Send message link or range:\n"
+    "  - Single message: `https://t.me/c/123456789/1`\n"
+    "  - Message range: `https://t.me/c/123456789/1-10`\n"
+    "  - Public channel: `https://t.me/channelname/1`\n"
+    "• Features:\n"
+    "  - Copies directly to your chat\n"
+    "  - Works with private channels\n"
+    "  - Supports message ranges\n\n"
+
+    "💡 **Tips & Tricks**\n"
+    "• Session Management:\n"
+    "  - Keep your session active\n"
+    "  - Delete session if you have issues\n"
+    "  - Create new session if needed\n"
+    "• Channel Access:\n"
+    "  - Join channels before copying\n"
+    "  - Use message links for private channels\n"
+    "  - Check your admin permissions\n"
+    "• Performance:\n"
+    "  - Check your message limits in 'My Stats'\n"
+    "  - Upgrade to VIP for unlimited copying\n"
+    "  - Keep your session active for faster copying\n"
+    "• Troubleshooting:\n"
+    "  - If copying fails, try smaller ranges\n"
+    "  - Check your account's message limits\n"
+    "  - Ensure you have proper permissions"
+)
+
+_HOW_TO_USE_AR = (
+    "📖 **ازاي تستخدم البوت**\n\n"
+
+    "🤖 **البوت بيعمل ايه بالظبط**\n"
+    "البوت ده بيساعدك تنقل الرسائل من قناة تيليجرام لقناة تانية. ممتاز لـ:\n"
+    "• نقل المحتوى من القنوات الخاصة لقناتك\n"
+    "• عمل نسخة احتياطية من الرسائل المهمة والوسائط\n"
+    "• نقل المحتوى بين القنوات\n"
+    "• حفظ الرسائل مع كل الوسائط (صور، فيديو، ملفات، الخ)\n"
+    "• نسخ الرسائل مباشرة في الشات بتاعك\n\n"
+
+    "🔑 **1. إنشاء Session**\n"
+    "• اضغط على 'Create Session' في القائمة الرئيسية\n"
+    "• اختار الطريقة اللي انت عايزها:\n"
+    "  - Phone Number: هات رقم تيليجرام بتاعك\n"
+    "  - Session String: استورد session موجود\n"
+    "• اتبع الخطوات:\n"
+    "  - هات الكود اللي هيجيلك على تيليجرام\n"
+    "  - لو عندك 2FA هات الباسورد بتاعه\n"
+    "• استنى تأكيد الـ session\n\n"
+
+    "📥 **2. تعيين Source Channel**\n"
+    "• اضغط على 'Set Source' في القائمة الرئيسية\n"
+    "• ابعت واحد من دول:\n"
+    "  - Channel username: `@channelname`\n"
+    "  - Channel link: `https://t.me/channelname`\n"
+    "  - Channel ID: `-1001234567890`\n"
+    "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
+    "  - Message link: `https://t.me/c/123456789/1`\n"
+    "• للقنوات الخاصة:\n"
+    "  - استخدم روابط الرسائل عشان أفضل نتيجة\n"
+    "  - تأكد إنك عضو في القناة\n"
+    "  - تأكد إن عندك صلاحية الوصول للرسائل\n\n"
+
+    "📤 **3. تعيين Target Channel**\n"
+    "• اضغط على 'Set Target' في القائمة الرئيسية\n"
+    "• ابعت معلومات القناة الهدف:\n"
+    "  - Channel username: `@channelname`\n"
+    "  - Channel link: `https://t.me/channelname`\n"
+    "  - Channel ID: `-1001234567890`\n"
+    "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
+    "• المطلوب:\n"
+    "  - لازم تكون admin في القناة الهدف\n"
+    "  - لازم عندك صلاحية النشر\n"
+    "  - القناة لازم تسمح بالنشر\n\n"
+
+    "📊 **4. تعيين Message Range**\n"
+    "• اضغط على 'Set Range' في القائمة الرئيسية\n"
+    "• اختار من دول:\n"
+    "  - Copy all: ينسخ القناة كلها\n"
+    "  - Set start: حدد أول رسالة\n"
+    "  - Set end: حدد آخر رسالة\n"
+    "• أشكال النطاق:\n"
+    "  - رسالة واحدة: `https://t.me/c/123456789/1`\n"
+    "  - نطاق رسائل: `https://t.me/c/123456789/1-10`\n"
+    "  - نطاق معرفات: `1-100`\n"
+    "• نصائح:\n"
+    "  - استخدم روابط الرسائل عشان اختيار دقيق\n"
+    "  - شوف معرفات الرسائل في القناة المصدر\n"
+    "  - أقصى نطاق هو 1000 رسالة\n\n"
+
+    "🚀 **5. بدء النسخ**\n"
+    "• اضغط على 'Start Copying' لما تكون جاهز\n"
+    "• البوت هيعرض:\n"
+    "  - عدد الرسائل اللي هتتنسخ\n"
+    "  - التقدم في الوقت الفعلي\n"
+    "  - سرعة النسخ والوقت المتبقي\n"
+    "  - عدد النجاح/الفشل\n"
+    "• أثناء النسخ:\n"
+    "  - متحذفش رسالة التقدم\n"
+    "  - خلي الـ session شغال\n"
+    "  - استنى رسالة الإكمال\n\n"
+
+    "📩 **نسخ سريع**\n"
+    "• اضغط على 'Copy Message(s) to Me'\n"
+    "• ابعت رابط الرسالة أو النطاق:\n"
+    "  - رسالة واحدة: `https://t.me/c/123456789/1`\n"
+    "  - نطاق رسائل: `https://t.me/c/123456789/1-10`\n"
+    "  - قناة عامة: `https://t.me/channelname/1`\n"
+    "• المميزات:\n"
+    "  - ينسخ مباشرة في الشات بتاعك\n"
+    "  - شغال مع القنوات الخاصة\n"
+    "  - يدعم نطاقات الرسائل\n\n"
+
+    "💡 **نصائح وحيل**\n"
+    "• إدارة الـ Session:\n"
+    "  - خلي الـ session شغال\n"
+    "  - احذف الـ session لو في مشكلة\n"
+    "  - اعمل session جديد لو محتاج\n"
+    "• الوصول للقنوات:\n"
+    "  - انضم للقنوات قبل النسخ\n"
+    "  - استخدم روابط الرسائل للقنوات الخاصة\n"
+    "  - تأكد من صلاحيات الـ admin\n"
+    "• الأداء:\n"
+    "  - شوف حدود الرسائل في 'My Stats'\n"
+    "  - اترقى لـ VIP عشان نسخ غير محدود\n"
+    "  - خلي الـ session شغال عشان نسخ أسرع\n"
+    "• حل المشاكل:\n"
+    "  - لو النسخ فشل، جرب نطاقات أصغر\n"
+    "  - شوف حدود رسائل حسابك\n"
+    "  - تأكد إن عندك الصلاحيات المطلوبة"
+)
+
+# Guide language -> (text, keyboard)
+_HOW_TO_USE_PAGES = {
+    "en": (_HOW_TO_USE_EN, _HOW_TO_USE_EN_MARKUP),
+    "ar": (_HOW_TO_USE_AR, _HOW_TO_USE_AR_MARKUP),
+}
+
 class ButtonHandler:
     def __init__(self, session_handler, user_manager, message_handler):
         self.session_handler = session_handler
         self.user_manager = user_manager
         self.message_handler = message_handler
+        
+        # Shared limiter for message edits so bursts stay under Telegram's flood limits
+        self._rate_limiter = RateLimiter(BOT_API_RATE_LIMIT)
+        # ...plus one per user, for Telegram's per-chat limit, least recently used first
+        self._chat_rate_limiters = {}
+        
+        # (counts, text) of the last admin user stats view, rebuilt only when the counts change
+        self._user_stats_view = None
+        
+        # Callback data -> handler lookup table
+        self._dispatch = {
+            CB_MAIN_MENU: self.show_main_menu,
+            CB_CREATE_SESSION: self.show_session_creation_menu,
+            CB_SESSION_PHONE: self.handle_phone_session_creation,
+            CB_SESSION_STRING: self.handle_string_session_creation,
+            CB_VIEW_SESSION: self.show_session_info,
+            CB_DELETE_SESSION: self.handle_session_deletion,
+            CB_SET_SOURCE: self.handle_source_channel_setup,
+            CB_SET_TARGET: self.handle_target_channel_setup,
+            CB_SET_RANGE: self.handle_message_range_setup,
+            CB_VIEW_STATS: self.show_user_stats,
+            CB_UPGRADE_VIP: self.show_vip_upgrade,
+            CB_VIP_BENEFITS: self.show_vip_benefits,
+            CB_PAYMENT_METHODS: self.show_payment_methods,
+            CB_PERSONAL_COPY: self.handle_personal_copy,
+            CB_HOW_TO_USE: self.show_how_to_use,
+            CB_HOW_TO_USE_AR: functools.partial(self.show_how_to_use, lang="ar"),
+            # Owner-only callbacks, gated by _OWNER_ACTIONS
+            CB_ADMIN_PANEL: self.show_admin_panel,
+            CB_PROMOTE_VIP: self.handle_vip_promotion,
+            CB_DEMOTE_VIP: self.handle_vip_demotion,
+            CB_SET_FREE_LIMIT: self.handle_set_free_limit,
+            CB_BROADCAST: self.handle_broadcast_start,
+            CB_USER_STATS: self.handle_user_stats,
+            CB_RESET_USER_LIMIT: self.handle_reset_user_limit,
+        }
+
+    async def _edit(self, callback_query: CallbackQuery, text: str, **kwargs):
+        """Rate-limited edit_message_text that waits out FloodWait and retries"""
+        user_id = callback_query.from_user.id
+        limiters = self._chat_rate_limiters
+        chat_limiter = limiters.pop(user_id, None) or RateLimiter(CHAT_RATE_LIMIT, CHAT_RATE_PERIOD)
+        # An idle bucket is full again, the same as a new one, so dropping it loses nothing
+        while limiters and limiters[next(iter(limiters))].is_idle():
+            del limiters[next(iter(limiters))]
+        limiters[user_id] = chat_limiter
+        for attempt in range(1, MAX_RETRIES + 1):
+            await chat_limiter.acquire()
+            await self._rate_limiter.acquire()
+            try:
+                return await callback_query.edit_message_text(text, **kwargs)
+            except FloodWait as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning("FloodWait on edit_message_text, sleeping %s s", e.value)
+                await asyncio.sleep(e.value)
+
+    async def _safe_error(self, callback_query: CallbackQuery, text: str, reply_markup: Optional[InlineKeyboardMarkup] = None):
+        """Show an error message, ignoring failures of the edit itself"""
+        try:
+            await self._edit(callback_query, text, reply_markup=reply_markup)
+        except Exception as e:
+            logger.debug("Could not show error message: %s", e)
+
+    def _get_session(self, user_id: int) -> dict:
+        """Get user session, reusing the lookup within the current callback"""
+        cache = _request_cache.get()
+        if cache is None:
+            return self.session_handler.get_user_session(user_id)
+        if 'session' not in cache:
+            cache['session'] = self.session_handler.get_user_session(user_id)
+        return cache['session']
+
+    def _get_stats(self, user_id: int) -> dict:
+        """Get user stats, reusing the lookup within the current callback"""
+        cache = _request_cache.get()
+        if cache is None:
+            return self.user_manager.get_user_stats(user_id)
+        if 'stats' not in cache:
+            cache['stats'] = self.user_manager.get_user_stats(user_id)
+        return cache['stats']
+
+    async def _prompt(self, callback_query: CallbackQuery, state: str, text: str, reply_markup: InlineKeyboardMarkup):
+        """Set an awaiting-input state and show its prompt, writing the session file alongside the edit"""
+        await asyncio.gather(
+            self.session_handler.update_user_session_async(callback_query.from_user.id, {'state': state}),
+            self._edit(callback_query, text, reply_markup=reply_markup)
+        )
+
+    async def _get_client(self, user_id: int):
+        """Get user client, reusing the lookup within the current callback"""
+        cache = _request_cache.get()
+        if cache is None:
+            return await self.session_handler.get_user_client(user_id)
+        if 'client' not in cache:
+            cache['client'] = await self.session_handler.get_user_client(user_id)
+        return cache['client']
 
     async def handle_callback(self, callback_query: CallbackQuery):
         """Handle all callback queries"""
+        token = _request_cache.set({})
         try:
-            await callback_query.answer()
             data = callback_query.data
             
-            if data == "main_menu":
-                await self.show_main_menu(callback_query)
-            elif data == "create_session":
-                await self.show_session_creation_menu(callback_query)
-            elif data == "session_phone":
-                await self.handle_phone_session_creation(callback_query)
-            elif data == "session_string":
-                await self.handle_string_session_creation(callback_query)
-            elif data == "view_session":
-                await self.show_session_info(callback_query)
-            elif data == "delete_session":
-                await self.handle_session_deletion(callback_query)
-            elif data == "set_source":
-                await self.handle_source_channel_setup(callback_query)
-            elif data == "set_target":
-                await self.handle_target_channel_setup(callback_query)
-            elif data == "set_range":
-                await self.handle_message_range_setup(callback_query)
-            elif data == "start_copy":
-                await self.handle_copy_start(callback_query)
-            elif data == "view_stats":
-                await self.show_user_stats(callback_query)
-            elif data == "upgrade_vip":
-                await self.show_vip_upgrade(callback_query)
-            elif data == "vip_benefits":
-                await self.show_vip_benefits(callback_query)
-            elif data == "payment_methods":
-                await self.show_payment_methods(callback_query)
-            elif data == "admin_panel" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.show_admin_panel(callback_query)
-            elif data == "promote_vip" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_vip_promotion(callback_query)
-            elif data == "demote_vip" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_vip_demotion(callback_query)
-            elif data == "set_free_limit" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_set_free_limit(callback_query)
-            elif data == "broadcast" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_broadcast_start(callback_query)
-            elif data == "user_stats" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_user_stats(callback_query)
-            elif data == "reset_user_limit" and self.user_manager.is_owner(callback_query.from_user.id):
-                await self.handle_reset_user_limit(callback_query)
-            elif data == "personal_copy":
-                await self.handle_personal_copy(callback_query)
-            elif data == "how_to_use":
-                await self.show_how_to_use(callback_query)
-            elif data == "how_to_use_ar":
-                await self.show_how_to_use_arabic(callback_query)
+            # Owner status comes from the per-callback stats cache, and is only read for owner-only actions
+            handler = self._dispatch.get(data)
+            if data in _OWNER_ACTIONS and not self._get_stats(callback_query.from_user.id)['is_owner']:
+                handler = None
+            
+            # Acknowledge the press while the handler runs instead of waiting on it first
+            answer_in_background(callback_query)
+            if handler:
+                await handler(callback_query)
             else:
-                await callback_query.edit_message_text("Unknown command. Please try again.")
+                await self._edit(callback_query, "Unknown command. Please try again.")
                 
         except Exception as e:
-            logger.error(f"Error in callback handler: {e}")
-            try:
-                await callback_query.edit_message_text("❌ An error occurred. Please try again.")
-            except:
-                pass
+            logger.error("Error in callback handler: %s", e)
+            await self._safe_error(callback_query, "❌ An error occurred. Please try again.")
+        finally:
+            _request_cache.reset(token)
 
     async def show_main_menu(self, callback_query: CallbackQuery):
         """Show main menu with current status"""
+        user_id = callback_query.from_user.id
         try:
-            user_id = callback_query.from_user.id
-            logger.info(f"Loading main menu for user {user_id}")
-            
-            # Get session data safely
-            try:
-                session = self.session_handler.get_user_session(user_id)
-            except Exception as e:
-                logger.error(f"Error getting session for user {user_id}: {e}")
-                session = {}
-            
-            # Check if user has active session
-            has_session = False
-            try:
-                client = await self.session_handler.get_user_client(user_id)
-                has_session = client is not None
-                logger.info(f"User {user_id} session status: {has_session}")
-            except Exception as e:
-                logger.warning(f"Error checking client for user {user_id}: {e}")
-                has_session = False
-            
-            # Get current settings safely
-            source_title = session.get('source_title') or 'Not set'
-            target_title = session.get('target_title') or 'Not set'
-            source_id = session.get('source_channel')
-            target_id = session.get('target_channel')
-            start_msg = session.get('start_msg_id') or 'Not set'
-            end_msg = session.get('end_msg_id') or 'Not set'
-            
-            # Status text
-            status_text = "🤖 **Telegram Save Restricted Content Bot**\n\n"
-            status_text += f"📱 **Session:** {'✅ Active' if has_session else '❌ Not created'}\n"
-            status_text += f"📥 **Source:** {source_title}\n"
-            if source_id:
-                status_text += f"   ID: `{source_id}`\n"
-            status_text += f"📤 **Target:** {target_title}\n"
-            if target_id:
-                status_text += f"   ID: `{target_id}`\n"
-            status_text += f"📊 **Range:** {start_msg} - {end_msg}\n"
-            
-            if start_msg != 'Not set' and end_msg != 'Not set':
-                try:
-                    total = int(end_msg) - int(start_msg) + 1
-                    status_text += f"📈 **Total Messages:** {total}\n"
-                except:
-                    pass
-            
-            # User stats
-            try:
-                stats = self.user_manager.get_user_stats(user_id)
-                if stats['is_owner']:
-                    status_text += f"\n👑 **Owner Account**"
-                elif stats['is_vip']:
-                    status_text += f"\n⭐ **VIP Account**"
-                else:
-                    status_text += f"\n🆓 **Free Account**"
-                    status_text += f"\n📨 **Messages Used:** {stats['message_count']}/{stats['message_limit']}"
-            except Exception as e:
-                logger.warning(f"Error getting user stats for {user_id}: {e}")
-                status_text += f"\n🆓 **Free Account**"
-            
-            # Create keyboard
-            keyboard = []
-            
-            # Add How to Use button at the top
-            keyboard.append([InlineKeyboardButton("📖 How to Use", callback_data="how_to_use")])
-            
-            # Session management
-            if has_session:
-                keyboard.append([InlineKeyboardButton("🔍 View Session", callback_data="view_session")])
-                keyboard.append([InlineKeyboardButton("🗑 Delete Session", callback_data="delete_session")])
-            else:
-                keyboard.append([InlineKeyboardButton("🔑 Create Session", callback_data="create_session")])
-            
-            # Channel setup (only if session exists)
-            if has_session:
-                keyboard.append([
-                    InlineKeyboardButton("📥 Set Source", callback_data="set_source"),
-                    InlineKeyboardButton("📤 Set Target", callback_data="set_target")
-                ])
-                keyboard.append([InlineKeyboardButton("📊 Set Range", callback_data="set_range")])
-                
-                # Copy button (only if all settings are configured)
-                if all([source_id, target_id, start_msg != 'Not set', end_msg != 'Not set']):
-                    keyboard.append([InlineKeyboardButton("🚀 Start Copying", callback_data="start_copy")])
-            
-            # Stats and VIP
-            keyboard.append([
-                InlineKeyboardButton("📈 My Stats", callback_data="view_stats"),
-                InlineKeyboardButton("⭐ Upgrade VIP", callback_data="upgrade_vip")
-            ])
-            
-            # New button for personal copy
-            keyboard.append([InlineKeyboardButton("📩 Copy Message(s) to Me", callback_data="personal_copy")])
-            
-            try:
-                if self.user_manager.is_owner(user_id):
-                    keyboard.append([InlineKeyboardButton("⚙️ Admin Panel", callback_data="admin_panel")])
-            except Exception as e:
-                logger.warning(f"Error checking owner status for {user_id}: {e}")
+            logger.info("Loading main menu for user %s", user_id)
+            
+            session = self._get_session(user_id)
+            
+            # Check if user has active session; answered from memory so redraws never wait on Telegram
+            has_session = self.session_handler.has_session(user_id)
+            logger.info("User %s session status: %s", user_id, has_session)
+            
+            # Get current settings
+            source_title, target_title, source_id, target_id, start_id, end_id = map(session.get, _MENU_SESSION_KEYS)
+            has_range = start_id is not None and end_id is not None
+            
+            total_line = f"📈 **Total Messages:** {end_id - start_id + 1}" if has_range else None
+            
+            # User stats (also carries the owner flag used for the admin button)
+            stats = self._get_stats(user_id)
+            is_owner = bool(stats['is_owner'])
+            account = 'owner' if is_owner else 'vip' if stats['is_vip'] else 'free'
+            
+            # Status text; None rows are skipped
+            rows = (
+                f"📱 **Session:** {'✅ Active' if has_session else '❌ Not created'}",
+                f"📥 **Source:** {source_title or 'Not set'}",
+                f"   ID: `{source_id}`" if source_id else None,
+                f"📤 **Target:** {target_title or 'Not set'}",
+                f"   ID: `{target_id}`" if target_id else None,
+                f"📊 **Range:** {start_id if start_id is not None else 'Not set'} - {end_id if end_id is not None else 'Not set'}",
+                total_line,
+            )
+            status_text = (
+                _MAIN_MENU_HEADER
+                + "\n".join(row for row in rows if row)
+                + "\n\n"
+                + _ACCOUNT_LINES[account].format_map(stats)
+            )
             
-            reply_markup = InlineKeyboardMarkup(keyboard)
+            # Pick the prebuilt keyboard for this combination
+            can_copy = bool(has_session and source_id and target_id and has_range)
+            reply_markup = _MAIN_MENU_MARKUPS[has_session, can_copy, is_owner]
             
-            await callback_query.edit_message_text(status_text, reply_markup=reply_markup,  )
-            logger.info(f"Main menu loaded successfully for user {user_id}")
+            await self._edit(callback_query, status_text, reply_markup=reply_markup)
+            logger.info("Main menu loaded successfully for user %s", user_id)
             
         except Exception as e:
-            logger.error(f"Error showing main menu for user {callback_query.from_user.id}: {e}")
+            logger.error("Error showing main menu for user %s: %s", user_id, e)
             try:
-                simple_keyboard = [[InlineKeyboardButton("🔑 Create Session", callback_data="create_session")]]
-                reply_markup = InlineKeyboardMarkup(simple_keyboard)
-                await callback_query.edit_message_text(
-                    "🤖 **Telegram Message Copier Bot**\n\n❌ Error loading full menu. Please start by creating a session.",
-                    reply_markup=reply_markup,
-                     
-                )
+                await self._edit(callback_query, _FALLBACK_MENU_TEXT, reply_markup=_FALLBACK_MENU_MARKUP)
             except Exception as fallback_error:
-                logger.error(f"Fallback menu also failed: {fallback_error}")
-                await callback_query.edit_message_text("❌ System error. Please restart the bot with /start")
+                logger.error("Fallback menu also failed: %s", fallback_error)
+                await self._edit(callback_query, "❌ System error. Please restart the bot with /start")
 
     async def show_session_creation_menu(self, callback_query: CallbackQuery):
         """Show session creation options"""
-        text = "🔑 **Create Session**\n\n"
-        text += "Choose how you want to create your session:\n\n"
-        text += "📱 **Phone Number:** Use your phone number to create a new session\n"
-        text += "📄 **Session String:** Import an existing session string"
-        
-        keyboard = [
-            [InlineKeyboardButton("📱 Phone Number", callback_data="session_phone")],
-            [InlineKeyboardButton("📄 Session String", callback_data="session_string")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._edit(callback_query, _SESSION_CREATION_TEXT, reply_markup=_SESSION_CREATION_MARKUP)
 
     async def handle_phone_session_creation(self, callback_query: CallbackQuery):
         """Handle phone number session creation"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_phone'})
-        
-        text = "📱 **Phone Number Session**\n\n"
-        text += "Please send your phone number in international format.\n"
-        text += "Example: `+1234567890`\n\n"
-        text += "⚠️ Make sure to include the country code with the + sign."
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="create_session")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_phone', _PHONE_SESSION_TEXT, _BACK_CREATE_SESSION_MARKUP)
 
     async def handle_string_session_creation(self, callback_query: CallbackQuery):
         """Handle session string import"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_session_string'})
-        
-        text = "📄 **Session String Import**\n\n"
-        text += "Please send your session string.\n\n"
-        text += "⚠️ **Important:** Never share your session string with others!\n"
-        text += "Anyone with your session string can access your Telegram account."
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="create_session")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_session_string', _STRING_SESSION_TEXT, _BACK_CREATE_SESSION_MARKUP)
 
     async def show_session_info(self, callback_query: CallbackQuery):
         """Show current session information"""
+        user_id = callback_query.from_user.id
+        logger.info("Loading session info for user %s", user_id)
+        
         try:
-            user_id = callback_query.from_user.id
-            logger.info(f"Loading session info for user {user_id}")
-            
-            try:
-                client = await self.session_handler.get_user_client(user_id)
-            except Exception as e:
-                logger.error(f"Error getting client for user {user_id}: {e}")
-                client = None
-            
-            if not client:
-                text = "❌ No active session found."
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-            else:
-                try:
-                    me = await client.get_me()
-                    text = "🔍 **Session Information**\n\n"
-                    text += f"👤 **Name:** {(me.first_name or '')} {(me.last_name or '')}".strip()
-                    text += f"\n📱 **Phone:** {me.phone_number or 'Not available'}"
-                    text += f"\n🆔 **User ID:** `{me.id}`"
-                    text += f"\n📧 **Username:** @{me.username or 'Not set'}"
-                    text += f"\n✅ **Status:** Connected"
-                    
-                    # Get session details safely
-                    try:
-                        session = self.session_handler.get_user_session(user_id)
-                        last_active = session.get('last_active', 'Unknown')
-                        if isinstance(last_active, (int, float)):
-                            from datetime import datetime
-                            last_active = datetime.fromtimestamp(last_active).strftime('%Y-%m-%d %H:%M:%S')
-                        text += f"\n📅 **Last Active:** {last_active}"
-                    except Exception as e:
-                        logger.warning(f"Error getting session details: {e}")
-                    
-                except Exception as e:
-                    logger.error(f"Error getting session info for user {user_id}: {e}")
-                    text = f"❌ Error getting session info: {str(e)}"
-                
-                keyboard = [
-                    [InlineKeyboardButton("🗑 Delete Session", callback_data="delete_session")],
-                    [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-                ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-            
+            client = await self._get_client(user_id)
         except Exception as e:
-            logger.error(f"Error showing session info: {e}")
+            logger.error("Error getting client for user %s: %s", user_id, e)
+            client = None
+        
+        if not client:
+            text = "❌ No active session found."
+            reply_markup = _BACK_MAIN_MARKUP
+        else:
             try:
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await callback_query.edit_message_text(
-                    "❌ Error loading session info. Please try again.",
-                    reply_markup=reply_markup
+                me = await client.get_me()
+                name = f"{(me.first_name or '')} {(me.last_name or '')}".strip()
+                
+                # Get session details
+                session = self._get_session(user_id)
+                last_active = session.get('last_active', 'Unknown')
+                if isinstance(last_active, (int, float)):
+                    last_active = datetime.fromtimestamp(last_active).isoformat(sep=' ', timespec='seconds')
+                
+                text = (
+                    f"🔍 **Session Information**\n\n"
+                    f"👤 **Name:** {name}\n"
+                    f"📱 **Phone:** {me.phone_number or 'Not available'}\n"
+                    f"🆔 **User ID:** `{me.id}`\n"
+                    f"📧 **Username:** @{me.username or 'Not set'}\n"
+                    f"✅ **Status:** Connected\n"
+                    f"📅 **Last Active:** {last_active}"
                 )
-            except:
-                pass
+                
+            except Exception as e:
+                logger.error("Error getting session info for user %s: %s", user_id, e)
+                text = f"❌ Error getting session info: {str(e)}"
+            
+            reply_markup = _SESSION_INFO_MARKUP
+        
+        await self._edit(callback_query, text, reply_markup=reply_markup)
 
     async def handle_session_deletion(self, callback_query: CallbackQuery):
         """Handle session deletion"""
+        user_id = callback_query.from_user.id
         try:
-            user_id = callback_query.from_user.id
-            logger.info(f"Deleting session for user {user_id}")
+            logger.info("Deleting session for user %s", user_id)
             
             # Clear session completely
             await self.session_handler.clear_user_session(user_id)
             
-            text = "✅ **Session Deleted**\n\n"
-            text += "Your session has been completely removed.\n"
-            text += "All stored data (channels, message ranges) has been cleared.\n\n"
-            text += "You can create a new session anytime."
-            
-            keyboard = [
-                [InlineKeyboardButton("🔑 Create New Session", callback_data="create_session")],
-                [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-            logger.info(f"Session deleted successfully for user {user_id}")
+            await self._edit(callback_query, _SESSION_DELETED_TEXT, reply_markup=_SESSION_DELETED_MARKUP)
+            logger.info("Session deleted successfully for user %s", user_id)
             
         except Exception as e:
-            logger.error(f"Error deleting session for user {callback_query.from_user.id}: {e}")
-            try:
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await callback_query.edit_message_text(
-                    "❌ Error deleting session. Please try again.",
-                    reply_markup=reply_markup
-                )
-            except:
-                pass
+            logger.error("Error deleting session for user %s: %s", user_id, e)
+            await self._safe_error(callback_query, "❌ Error deleting session. Please try again.", _BACK_MAIN_MARKUP)
 
     async def handle_source_channel_setup(self, callback_query: CallbackQuery):
         """Handle source channel setup"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_source_channel'})
-        
-        text = "📥 **Set Source Channel**\n\n"
-        text += "Send the source channel information:\n\n"
-        text += "✅ **Supported formats:**\n"
-        text += "• Channel username: `@channelname`\n"
-        text += "• Channel link: `https://t.me/channelname`\n"
-        text += "• Channel ID: `-1001234567890`\n"
-        text += "• Invitation link: `https://t.me/+AbCdEfGhIj`\n"
-        text += "• Message link: `https://t.me/c/123456789/1` or `https://t.me/channelname/1`\n\n"
-        text += "💡 **For private channels:** Use invitation links or message links for best results"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_source_channel', _SOURCE_CHANNEL_TEXT, _BACK_MAIN_MARKUP)
 
     async def handle_target_channel_setup(self, callback_query: CallbackQuery):
         """Handle target channel setup"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_target_channel'})
-        
-        text = "📤 **Set Target Channel**\n\n"
-        text += "Send the target channel information:\n\n"
-        text += "✅ **Supported formats:**\n"
-        text += "• Channel username: `@channelname`\n"
-        text += "• Channel link: `https://t.me/channelname`\n"
-        text += "• Channel ID: `-1001234567890`\n"
-        text += "• **Invitation link: `https://t.me/+AbCdEfGhIj`**\n\n"
-        text += "⚠️ **Note:** You must be admin in the target channel to copy messages"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_target_channel', _TARGET_CHANNEL_TEXT, _BACK_MAIN_MARKUP)
 
     async def handle_message_range_setup(self, callback_query: CallbackQuery):
         """Handle message range setup"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_message_range'})
-        
-        text = "📊 **Set Message Range**\n\n"
-        text += "Send the message range you want to copy:\n\n"
-        text += "**Format:** `start_id-end_id`\n"
-        text += "**Examples:**\n"
-        text += "• `1-100` - Copy messages 1 to 100\n"
-        text += "• `50-150` - Copy messages 50 to 150\n"
-        text += "• `1000-2000` - Copy messages 1000 to 2000\n\n"
-        text += "💡 **Tip:** Check the source channel to find the message IDs you want"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-
-    async def handle_copy_start(self, callback_query: CallbackQuery):
-        """Handle copy operation start"""
-        try:
-            user_id = callback_query.from_user.id
-            session = self.session_handler.get_user_session(user_id)
-            
-            # Validate all required data
-            source_id = session.get('source_channel')
-            target_id = session.get('target_channel')
-            start_msg_id = session.get('start_msg_id')
-            end_msg_id = session.get('end_msg_id')
-            
-            if not all([source_id, target_id, start_msg_id, end_msg_id]):
-                text = "❌ **Missing Information**\n\n"
-                text += "Please configure all settings before starting:\n"
-                if not source_id:
-                    text += "• Source channel not set\n"
-                if not target_id:
-                    text += "• Target channel not set\n"
-                if not start_msg_id or not end_msg_id:
-                    text += "• Message range not set\n"
-                
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-                return
-            
-            # Check user limits
-            if not self.user_manager.can_send_messages(user_id):
-                text = "❌ **Message Limit Reached**\n\n"
-                text += "You have reached your daily message limit.\n"
-                text += "Upgrade to VIP for unlimited messages!"
-                
-                keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-                return
-            
-            # Show copy confirmation
-            source_title = session.get('source_title', 'Unknown')
-            target_title = session.get('target_title', 'Unknown')
-            total_messages = end_msg_id - start_msg_id + 1
-            
-            text = "🚀 **Ready to Copy**\n\n"
-            text += f"📥 **From:** {source_title}\n"
-            text += f"📤 **To:** {target_title}\n"
-            text += f"📊 **Range:** {start_msg_id} - {end_msg_id}\n"
-            text += f"📈 **Total:** {total_messages} messages\n\n"
-            text += "⚡ Starting copy operation..."
-            
-            await callback_query.edit_message_text(text,  )
-            
-            # Start copying in background
-            asyncio.create_task(self._perform_copy_operation(callback_query, user_id, source_id, target_id, start_msg_id, end_msg_id))
-            
-        except Exception as e:
-            logger.error(f"Error starting copy: {e}")
-            await callback_query.edit_message_text("❌ Error starting copy operation.")
-
-    async def _perform_copy_operation(self, callback_query: CallbackQuery, user_id: int, source_id: str, target_id: str, start_msg_id: int, end_msg_id: int):
-        """Perform the actual copy operation"""
-        try:
-            # Progress callback
-            async def progress_callback(copied, failed, total):
-                try:
-                    progress_text = f"🔄 **Copying in Progress**\n\n"
-                    progress_text += f"✅ **Copied:** {copied}\n"
-                    progress_text += f"❌ **Failed:** {failed}\n"
-                    progress_text += f"📊 **Total:** {total}\n"
-                    progress_text += f"📈 **Progress:** {((copied + failed) / total * 100):.1f}%"
-                    
-                    await callback_query.edit_message_text(progress_text,  )
-                except:
-                    pass
-            
-            success, result = await self.message_handler.copy_messages(
-                user_id, source_id, target_id, start_msg_id, end_msg_id, progress_callback
-            )
-            
-            # Show final result
-            if success:
-                text = f"✅ **Copy Completed!**\n\n{result}"
-            else:
-                text = f"❌ **Copy Failed**\n\n{result}"
-            
-            keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-            
-        except Exception as e:
-            logger.error(f"Error in copy operation: {e}")
-            try:
-                text = f"❌ **Copy Failed**\n\nError: {str(e)}"
-                keyboard = [[InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]]
-                reply_markup = InlineKeyboardMarkup(keyboard)
-                await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-            except:
-                pass
+        await self._prompt(callback_query, 'awaiting_message_range', _MESSAGE_RANGE_TEXT, _BACK_MAIN_MARKUP)
 
     async def show_user_stats(self, callback_query: CallbackQuery):
         """Show user statistics"""
-        try:
-            user_id = callback_query.from_user.id
-            stats = self.user_manager.get_user_stats(user_id)
-            
-            text = "📈 **Your Statistics**\n\n"
-            
-            if stats['is_owner']:
-                text += "👑 **Account Type:** Owner\n"
-                text += "📨 **Messages:** Unlimited\n"
-                text += f"⚡ **Speed:** {stats['speed_limit']:.1f} MB/s\n"
-            elif stats['is_vip']:
-                text += "⭐ **Account Type:** VIP\n"
-                text += "📨 **Messages:** Unlimited\n"
-                text += f"⚡ **Speed:** {stats['speed_limit']:.1f} MB/s\n"
-            else:
-                text += "🆓 **Account Type:** Free\n"
-                text += f"📨 **Messages Used:** {stats['message_count']}/{stats['message_limit']}\n"
-                text += f"📨 **Remaining:** {stats['remaining_messages']}\n"
-                text += f"⚡ **Speed:** {stats['speed_limit']:.1f} MB/s\n"
-            
-            text += f"\n💾 **Total Sent:** {stats['message_count']}"
-            
-            keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
-            
-        except Exception as e:
-            logger.error(f"Error showing stats: {e}")
-            await callback_query.edit_message_text("❌ Error loading statistics.")
+        user_id = callback_query.from_user.id
+        stats = self._get_stats(user_id)
+        
+        account = 'owner' if stats['is_owner'] else 'vip' if stats['is_vip'] else 'free'
+        text = _USER_STATS_PAGES[account].format_map(stats)
+        
+        await self._edit(callback_query, text, reply_markup=_BACK_MAIN_MARKUP)
 
     async def show_admin_panel(self, callback_query: CallbackQuery):
         """Show admin panel (owner only)"""
-        text = "⚙️ **Admin Panel**\n\n"
-        text += "👑 **Owner Controls:**\n"
-        text += "• Promote users to VIP\n"
-        text += "• Remove VIP status\n"
-        text += "• Change message limit for free users\n"
-        text += "• Broadcast message to all users\n"
-        text += "• View user statistics"
-        
-        keyboard = [
-            [InlineKeyboardButton("⭐ Promote to VIP", callback_data="promote_vip")],
-            [InlineKeyboardButton("❌ Remove VIP", callback_data="demote_vip")],
-            [InlineKeyboardButton("✏️ Set Free User Limit", callback_data="set_free_limit")],
-            [InlineKeyboardButton("📢 Broadcast", callback_data="broadcast")],
-            [InlineKeyboardButton("📊 User Stats", callback_data="user_stats")],
-            [InlineKeyboardButton("🔄 Reset User Limit", callback_data="reset_user_limit")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._edit(callback_query, _ADMIN_PANEL_TEXT, reply_markup=_ADMIN_PANEL_MARKUP)
 
     async def handle_vip_promotion(self, callback_query: CallbackQuery):
         """Handle VIP promotion"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_vip_promotion'})
-        
-        text = "⭐ **Promote to VIP**\n\n"
-        text += "Send the user ID to promote to VIP status.\n"
-        text += "Example: `123456789`"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_vip_promotion', _VIP_PROMOTION_TEXT, _BACK_ADMIN_MARKUP)
 
     async def handle_vip_demotion(self, callback_query: CallbackQuery):
         """Handle VIP demotion"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_vip_demotion'})
-        
-        text = "❌ **Remove VIP Status**\n\n"
-        text += "Send the user ID to remove VIP status.\n"
-        text += "Example: `123456789`"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_vip_demotion', _VIP_DEMOTION_TEXT, _BACK_ADMIN_MARKUP)
 
     async def handle_set_free_limit(self, callback_query: CallbackQuery):
         """Handle setting free user message limit"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_free_limit'})
-        
-        text = "✏️ **Set Free User Message Limit**\n\n"
-        text += "Send the new daily message limit for free users (number):"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_free_limit', _FREE_LIMIT_TEXT, _BACK_ADMIN_MARKUP)
 
     async def handle_broadcast_start(self, callback_query: CallbackQuery):
         """Handle broadcast message to all users"""
-        user_id = callback_query.from_user.id
-        self.session_handler.update_user_session(user_id, {'state': 'awaiting_broadcast'})
-        
-        text = "📢 **Broadcast**\n\n"
-        text += "Send the message you want to broadcast to all users:"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_broadcast', _BROADCAST_TEXT, _BACK_ADMIN_MARKUP)
 
     async def handle_user_stats(self, callback_query: CallbackQuery):
         """Handle viewing user statistics"""
-        from database import DatabaseManager
-        db = DatabaseManager()
-        total = db.cursor.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-        vips = db.cursor.execute('SELECT COUNT(*) FROM users WHERE is_vip=1').fetchone()[0]
-        owners = db.cursor.execute('SELECT COUNT(*) FROM users WHERE is_owner=1').fetchone()[0]
+        # Counts come from the user manager's TTL cache, so rapid clicks skip the database,
+        # and a cold cache is filled off the event loop
+        counts = await self.user_manager.get_user_counts_async()
+        if self._user_stats_view is None or self._user_stats_view[0] is not counts:
+            self._user_stats_view = (counts, _USER_STATS_TEXT.format_map(counts))
         
-        text = f"📊 **User Stats**\n\n"
-        text += f"Total users: {total}\n"
-        text += f"VIPs: {vips}\n"
-        text += f"Owners: {owners}"
-        
-        keyboard = [[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._edit(callback_query, self._user_stats_view[1], reply_markup=_BACK_ADMIN_MARKUP)
 
     async def show_vip_upgrade(self, callback_query: CallbackQuery):
         """Show VIP upgrade info and options."""
-        text = (
-            "⭐ <b>Upgrade to VIP</b> ⭐\n\n"
-            "Unlock unlimited messages, faster speed, and premium support!\n\n"
-            "<b>VIP Features:</b>\n"
-            "• Unlimited message copying\n"
-            "• Increased speed\n"
-            "• Priority support\n\n"
-            "To become VIP, see payment methods or contact the admin."
-        )
-        keyboard = [
-            [InlineKeyboardButton("💎 VIP Benefits", callback_data="vip_benefits")],
-            [InlineKeyboardButton("💳 Payment Methods", callback_data="payment_methods")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await callback_query.edit_message_text(text, reply_markup=reply_markup)
+        await self._edit(callback_query, _VIP_UPGRADE_TEXT, reply_markup=_VIP_UPGRADE_MARKUP)
 
     async def show_vip_benefits(self, callback_query: CallbackQuery):
         """Show VIP benefits."""
-        text = (
-            "💎 <b>VIP Benefits</b> 💎\n\n"
-            "• Unlimited message copying\n"
-            "• Increased speed (up to 1 Gb/s)\n"
-            "• No daily limits\n"
-            "• Priority support from the admin\n"
-            "• Early access to new features\n\n"
-            "Ready to upgrade? See payment methods or contact the admin."
-        )
-        keyboard = [
-            [InlineKeyboardButton("💳 Payment Methods", callback_data="payment_methods")],
-            [InlineKeyboardButton("🔙 Back", callback_data="upgrade_vip")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await callback_query.edit_message_text(text, reply_markup=reply_markup)
+        await self._edit(callback_query, _VIP_BENEFITS_TEXT, reply_markup=_VIP_BENEFITS_MARKUP)
 
     async def show_payment_methods(self, callback_query: CallbackQuery):
         """Show payment methods and admin contact."""
-        text = (
-            "💳 <b>Payment Methods</b> 💳\n\n"
-            "Lifetime VIP: <b>100 EGP</b> or <b>3$</b>\n\n"
-            "<b>Binance ID 🏦:</b> <code>789564679</code>\n"
-            "USDT (TRC 20) 📱: <code>TE1S4PeEws1xq5QaehdrZFW4fPZYZbYiUu</code>\n"
-            "Vodafone Cash 🔴: <code>01015339426</code>\n"
-            "Instapay 💳: <code>mohamed1573@instapay</code>\n\n"
-            "After payment, send your user ID and payment proof to the admin.\n\n"
-            "<b>Admin:</b> <a href='https://t.me/M7MED1573'>@M7MED1573</a>"
-        )
-        keyboard = [
-            [InlineKeyboardButton("🔙 Back", callback_data="upgrade_vip")],
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        await callback_query.edit_message_text(text, reply_markup=reply_markup)
+        await self._edit(callback_query, _PAYMENT_METHODS_TEXT, reply_markup=_BACK_UPGRADE_VIP_MARKUP)
 
     async def handle_reset_user_limit(self, callback_query: CallbackQuery):
         """Prompt owner to enter user ID to reset message count."""
-        await callback_query.edit_message_text(
+        await self._prompt(
+            callback_query,
+            'awaiting_reset_user_id',
             "Send the user ID to reset their message count limit:",
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="admin_panel")]])
+            _BACK_ADMIN_MARKUP
         )
-        # Set state for the owner
-        self.session_handler.update_user_session(callback_query.from_user.id, {"state": "awaiting_reset_user_id"})
 
     async def handle_personal_copy(self, callback_query: CallbackQuery):
         """Prompt user to send a message link or range to copy to themselves."""
-        text = "📩 **Copy Messages to Me**\n\n"
-        text += "Send me a message link or range to copy:\n\n"
-        text += "✅ **Supported formats:**\n"
-        text += "• Single message: `https://t.me/c/123456789/1`\n"
-        text += "• Message range: `https://t.me/c/123456789/1-10`\n"
-        text += "• Public channel: `https://t.me/channelname/1`\n\n"
-        text += "💡 **Tips:**\n"
-        text += "• For private channels, use message links\n"
-        text += "• You can copy multiple messages by using a range\n"
-        text += "• Make sure you have access to the messages"
-        
-        await callback_query.edit_message_text(
-            text,
-            reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("🔙 Back", callback_data="main_menu")]])
-        )
-        self.session_handler.update_user_session(callback_query.from_user.id, {"state": "awaiting_personal_copy_link"})
-
-    async def show_how_to_use(self, callback_query: CallbackQuery):
-        """Show comprehensive guide"""
-        text = "📖 **How to Use the Bot**\n\n"
-        
-        text += "🤖 **What This Bot Does**\n"
-        text += "This bot helps you copy messages from one Telegram channel to another. It's perfect for:\n"
-        text += "• Copying content from private channels to your own channel\n"
-        text += "• Backing up important messages and media\n"
-        text += "• Transferring content between channels\n"
-        text += "• Saving messages with all their media (photos, videos, files, etc.)\n"
-        text += "• Copying messages directly to your personal chat\n\n"
-        
-        text += "🔑 **1. Create Session**\n"
-        text += "• Click 'Create Session' in the main menu\n"
-        text += "• Choose your preferred method:\n"
-        text += "  - Phone Number: Enter your Telegram phone number\n"
-        text += "  - Session String: Import an existing session\n"
-        text += "• Follow the authentication steps:\n"
-        text += "  - Enter verification code sent to your Telegram\n"
-        text += "  - Enter 2FA password if enabled\n"
-        text += "• Wait for session confirmation\n\n"
-        
-        text += "📥 **2. Set Source Channel**\n"
-        text += "• Click 'Set Source' in the main menu\n"
-        text += "• Send one of these formats:\n"
-        text += "  - Channel username: `@channelname`\n"
-        text += "  - Channel link: `https://t.me/channelname`\n"
-        text += "  - Channel ID: `-1001234567890`\n"
-        text += "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
-        text += "  - Message link: `https://t.me/c/123456789/1`\n"
-        text += "• For private channels:\n"
-        text += "  - Use message links for best results\n"
-        text += "  - Make sure you're a member of the channel\n"
-        text += "  - Your account must have access to the messages\n\n"
-        
-        text += "📤 **3. Set Target Channel**\n"
-        text += "• Click 'Set Target' in the main menu\n"
-        text += "• Send target channel information:\n"
-        text += "  - Channel username: `@channelname`\n"
-        text += "  - Channel link: `https://t.me/channelname`\n"
-        text += "  - Channel ID: `-1001234567890`\n"
-        text += "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
-        text += "• Important requirements:\n"
-        text += "  - You must be an admin in the target channel\n"
-        text += "  - Your account must have posting permissions\n"
-        text += "  - Channel must allow message posting\n\n"
-        
-        text += "📊 **4. Set Message Range**\n"
-        text += "• Click 'Set Range' in the main menu\n"
-        text += "• Choose from these options:\n"
-        text += "  - Copy all: Copies entire channel\n"
-        text += "  - Set start: Specify first message\n"
-        text += "  - Set end: Specify last message\n"
-        text += "• Range formats:\n"
-        text += "  - Single message: `https://t.me/c/123456789/1`\n"
-        text += "  - Message range: `https://t.me/c/123456789/1-10`\n"
-        text += "  - ID range: `1-100`\n"
-        text += "• Tips for range selection:\n"
-        text += "  - Use message links for precise selection\n"
-        text += "  - Check message IDs in the source channel\n"
-        text += "  - Maximum range is 1000 messages\n\n"
-        
-        text += "🚀 **5. Start Copying**\n"
-        text += "• Click 'Start Copying' when ready\n"
-        text += "• The bot will show:\n"
-        text += "  - Total messages to copy\n"
-        text += "  - Real-time progress\n"
-        text += "  - Copy speed and time remaining\n"
-        text += "  - Success/failure count\n"
-        text += "• During copying:\n"
-        text += "  - Don't delete the progress message\n"
-        text += "  - Keep your session active\n"
-        text += "  - Wait for completion message\n\n"
-        
-        text += "📩 **Quick Copy to Me**\n"
-        text += "• Click 'Copy Message(s) to Me'\n"
-        text += "• Send message link or range:\n"
-        text += "  - Single message: `https://t.me/c/123456789/1`\n"
-        text += "  - Message range: `https://t.me/c/123456789/1-10`\n"
-        text += "  - Public channel: `https://t.me/channelname/1`\n"
-        text += "• Features:\n"
-        text += "  - Copies directly to your chat\n"
-        text += "  - Works with private channels\n"
-        text += "  - Supports message ranges\n\n"
-        
-        text += "💡 **Tips & Tricks**\n"
-        text += "• Session Management:\n"
-        text += "  - Keep your session active\n"
-        text += "  - Delete session if you have issues\n"
-        text += "  - Create new session if needed\n"
-        text += "• Channel Access:\n"
-        text += "  - Join channels before copying\n"
-        text += "  - Use message links for private channels\n"
-        text += "  - Check your admin permissions\n"
-        text += "• Performance:\n"
-        text += "  - Check your message limits in 'My Stats'\n"
-        text += "  - Upgrade to VIP for unlimited copying\n"
-        text += "  - Keep your session active for faster copying\n"
-        text += "• Troubleshooting:\n"
-        text += "  - If copying fails, try smaller ranges\n"
-        text += "  - Check your account's message limits\n"
-        text += "  - Ensure you have proper permissions"
-        
-        keyboard = [
-            [InlineKeyboardButton("🇦🇪 العربية", callback_data="how_to_use_ar")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+        await self._prompt(callback_query, 'awaiting_personal_copy_link', _PERSONAL_COPY_TEXT, _BACK_MAIN_MARKUP)
 
-    async def show_how_to_use_arabic(self, callback_query: CallbackQuery):
-        """Show comprehensive guide in Egyptian Arabic"""
-        text = "📖 **ازاي تستخدم البوت**\n\n"
-        
-        text += "🤖 **البوت بيعمل ايه بالظبط**\n"
-        text += "البوت ده بيساعدك تنقل الرسائل من قناة تيليجرام لقناة تانية. ممتاز لـ:\n"
-        text += "• نقل المحتوى من القنوات الخاصة لقناتك\n"
-        text += "• عمل نسخة احتياطية من الرسائل المهمة والوسائط\n"
-        text += "• نقل المحتوى بين القنوات\n"
-        text += "• حفظ الرسائل مع كل الوسائط (صور، فيديو، ملفات، الخ)\n"
-        text += "• نسخ الرسائل مباشرة في الشات بتاعك\n\n"
-        
-        text += "🔑 **1. إنشاء Session**\n"
-        text += "• اضغط على 'Create Session' في القائمة الرئيسية\n"
-        text += "• اختار الطريقة اللي انت عايزها:\n"
-        text += "  - Phone Number: هات رقم تيليجرام بتاعك\n"
-        text += "  - Session String: استورد session موجود\n"
-        text += "• اتبع الخطوات:\n"
-        text += "  - هات الكود اللي هيجيلك على تيليجرام\n"
-        text += "  - لو عندك 2FA هات الباسورد بتاعه\n"
-        text += "• استنى تأكيد الـ session\n\n"
-        
-        text += "📥 **2. تعيين Source Channel**\n"
-        text += "• اضغط على 'Set Source' في القائمة الرئيسية\n"
-        text += "• ابعت واحد من دول:\n"
-        text += "  - Channel username: `@channelname`\n"
-        text += "  - Channel link: `https://t.me/channelname`\n"
-        text += "  - Channel ID: `-1001234567890`\n"
-        text += "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
-        text += "  - Message link: `https://t.me/c/123456789/1`\n"
-        text += "• للقنوات الخاصة:\n"
-        text += "  - استخدم روابط الرسائل عشان أفضل نتيجة\n"
-        text += "  - تأكد إنك عضو في القناة\n"
-        text += "  - تأكد إن عندك صلاحية الوصول للرسائل\n\n"
-        
-        text += "📤 **3. تعيين Target Channel**\n"
-        text += "• اضغط على 'Set Target' في القائمة الرئيسية\n"
-        text += "• ابعت معلومات القناة الهدف:\n"
-        text += "  - Channel username: `@channelname`\n"
-        text += "  - Channel link: `https://t.me/channelname`\n"
-        text += "  - Channel ID: `-1001234567890`\n"
-        text += "  - Invitation link: `https://t.me/+AbCdEfGhIj`\n"
-        text += "• المطلوب:\n"
-        text += "  - لازم تكون admin في القناة الهدف\n"
-        text += "  - لازم عندك صلاحية النشر\n"
-        text += "  - القناة لازم تسمح بالنشر\n\n"
-        
-        text += "📊 **4. تعيين Message Range**\n"
-        text += "• اضغط على 'Set Range' في القائمة الرئيسية\n"
-        text += "• اختار من دول:\n"
-        text += "  - Copy all: ينسخ القناة كلها\n"
-        text += "  - Set start: حدد أول رسالة\n"
-        text += "  - Set end: حدد آخر رسالة\n"
-        text += "• أشكال النطاق:\n"
-        text += "  - رسالة واحدة: `https://t.me/c/123456789/1`\n"
-        text += "  - نطاق رسائل: `https://t.me/c/123456789/1-10`\n"
-        text += "  - نطاق معرفات: `1-100`\n"
-        text += "• نصائح:\n"
-        text += "  - استخدم روابط الرسائل عشان اختيار دقيق\n"
-        text += "  - شوف معرفات الرسائل في القناة المصدر\n"
-        text += "  - أقصى نطاق هو 1000 رسالة\n\n"
-        
-        text += "🚀 **5. بدء النسخ**\n"
-        text += "• اضغط على 'Start Copying' لما تكون جاهز\n"
-        text += "• البوت هيعرض:\n"
-        text += "  - عدد الرسائل اللي هتتنسخ\n"
-        text += "  - التقدم في الوقت الفعلي\n"
-        text += "  - سرعة النسخ والوقت المتبقي\n"
-        text += "  - عدد النجاح/الفشل\n"
-        text += "• أثناء النسخ:\n"
-        text += "  - متحذفش رسالة التقدم\n"
-        text += "  - خلي الـ session شغال\n"
-        text += "  - استنى رسالة الإكمال\n\n"
-        
-        text += "📩 **نسخ سريع**\n"
-        text += "• اضغط على 'Copy Message(s) to Me'\n"
-        text += "• ابعت رابط الرسالة أو النطاق:\n"
-        text += "  - رسالة واحدة: `https://t.me/c/123456789/1`\n"
-        text += "  - نطاق رسائل: `https://t.me/c/123456789/1-10`\n"
-        text += "  - قناة عامة: `https://t.me/channelname/1`\n"
-        text += "• المميزات:\n"
-        text += "  - ينسخ مباشرة في الشات بتاعك\n"
-        text += "  - شغال مع القنوات الخاصة\n"
-        text += "  - يدعم نطاقات الرسائل\n\n"
-        
-        text += "💡 **نصائح وحيل**\n"
-        text += "• إدارة الـ Session:\n"
-        text += "  - خلي الـ session شغال\n"
-        text += "  - احذف الـ session لو في مشكلة\n"
-        text += "  - اعمل session جديد لو محتاج\n"
-        text += "• الوصول للقنوات:\n"
-        text += "  - انضم للقنوات قبل النسخ\n"
-        text += "  - استخدم روابط الرسائل للقنوات الخاصة\n"
-        text += "  - تأكد من صلاحيات الـ admin\n"
-        text += "• الأداء:\n"
-        text += "  - شوف حدود الرسائل في 'My Stats'\n"
-        text += "  - اترقى لـ VIP عشان نسخ غير محدود\n"
-        text += "  - خلي الـ session شغال عشان نسخ أسرع\n"
-        text += "• حل المشاكل:\n"
-        text += "  - لو النسخ فشل، جرب نطاقات أصغر\n"
-        text += "  - شوف حدود رسائل حسابك\n"
-        text += "  - تأكد إن عندك الصلاحيات المطلوبة"
-        
-        keyboard = [
-            [InlineKeyboardButton("🇬🇧 English", callback_data="how_to_use")],
-            [InlineKeyboardButton("🔙 Back", callback_data="main_menu")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await callback_query.edit_message_text(text, reply_markup=reply_markup,  )
+    async def show_how_to_use(self, callback_query: CallbackQuery, lang: str = "en"):
+        """Show comprehensive guide in English or Egyptian Arabic"""
+        text, reply_markup = _HOW_TO_USE_PAGES[lang]
+        await self._edit(callback_query, text, reply_markup=reply_markup)
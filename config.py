@@ -6,17 +6,19 @@ Instructions:
 1. Get your API credentials from https://my.telegram.org/apps
 2. Create a bot with @BotFather and get the bot token
 3. Get your Telegram user ID (you can use @userinfobot)
-4. Fill in the values below
+4. Export API_ID, API_HASH and BOT_TOKEN in the environment, and fill in the values below
 """
 
+import os
+
 # Telegram API Credentials
 # Get these from https://my.telegram.org/apps
 # 1. Log in with your Telegram account
 # 2. Create a new application or use an existing one
-# 3. Copy the api_id and api_hash values below
-API_ID = 28129546  # Replace with your API ID (integer)
-API_HASH = "f0985e4f023d1406fe8ee76717651e85"  # Replace with your API Hash (string)
-BOT_TOKEN = "7704671917:AAFlZdAChPWPlb6yazFMHTRFEXTWSVsTfKc"  # Your Bot Token
+# 3. Export the api_id and api_hash values as API_ID and API_HASH
+API_ID = int(os.getenv("API_ID", "0"))  # Your API ID (integer)
+API_HASH = os.getenv("API_HASH", "")  # Your API Hash (string)
+BOT_TOKEN = os.getenv("BOT_TOKEN", "")  # Your Bot Token from @BotFather
 
 # Bot Owner ID
 OWNER_ID = 933493534  # Your Telegram ID
@@ -26,19 +28,32 @@ ADMIN_USER_IDS = [OWNER_ID]  # Add more admin IDs if needed
 
 # Database Settings
 DATABASE_URL = "sqlite:///bot.db"  # SQLite database URL
+DB_STATEMENT_CACHE_SIZE = 128  # Compiled SQL statements kept per connection
+DB_MMAP_SIZE = 256 * 1024 * 1024  # Bytes of the database file memory-mapped for reads
+DB_CACHE_SIZE_KB = 20000  # SQLite page cache size in KiB
+DB_COUNT_FLUSH_THRESHOLD = 50  # Buffered message count increments written per batch
+DB_READ_POOL_SIZE = 4  # Read-only connections for queries offloaded to worker threads
 
 # Message Limits
 DEFAULT_MESSAGE_LIMIT = 20  # Default message limit for free users
-VIP_MESSAGE_LIMIT = float('inf')  # Unlimited messages for VIP users
+VIP_MESSAGE_LIMIT = None  # No message limit for VIP users
 
 # Speed Limits (delays in seconds between messages)
 FREE_USER_DELAY = 0.5  # Delay for free users (limits speed)
 VIP_USER_DELAY = 0.1   # Minimal delay for VIP users (maximum speed)
 OWNER_DELAY = 0.05     # Minimal delay for owner (maximum speed)
 
+# Cache Settings
+USER_STATS_CACHE_TTL = 60  # seconds a user's stats are reused; every write path also invalidates them
+ADMIN_STATS_CACHE_TTL = 10  # seconds the admin user counts are reused
+
 # Session Settings
 SESSION_NAME = "copier_bot"  # Session name for Pyrogram
 SESSION_STRING = None  # Session string for user account (if needed)
+CLIENT_PING_TIMEOUT = 1  # seconds to wait for the health check when refreshing a cached user client
+CLIENT_IDLE_TIMEOUT = 25 * 60  # seconds before an unused user client is disconnected
+CLIENT_REAPER_INTERVAL = 60  # seconds between idle client sweeps
+CLIENT_REVALIDATE_INTERVAL = 10 * 60  # seconds between auth checks of connected user clients
 
 # Logging Settings
 LOG_LEVEL = "INFO"  # Logging level (DEBUG, INFO, WARNING, ERROR, CRITICAL)
@@ -74,4 +89,14 @@ SESSION_FILE = "session.json"
 # Copy settings
 MAX_RETRIES = 3
 RETRY_DELAY = 5  # seconds
-PROGRESS_UPDATE_INTERVAL = 10  # update progress every N messages 
+PROGRESS_UPDATE_INTERVAL = 10  # update progress every N messages
+PROGRESS_EDIT_INTERVAL = 2  # minimum seconds between progress message edits
+MAX_CONCURRENT_COPIES = 3  # background copy jobs allowed to run at the same time
+PERSONAL_COPY_WORKERS = 4  # messages fetched/downloaded at once by the copy-to-me handler
+MEDIA_SPOOL_SIZE = 8 * 1024 * 1024  # bytes of a downloaded file kept in RAM before spilling to disk
+TEMP_DOWNLOAD_DIR = "temp_downloads"  # where copy_messages stores media it has to re-upload
+BOT_API_RATE_LIMIT = 25  # max bot message edits per second across all users
+CHAT_RATE_LIMIT = 3  # max bot message edits per CHAT_RATE_PERIOD in a single chat
+CHAT_RATE_PERIOD = 3  # seconds
+BROADCAST_BATCH_SIZE = 30  # broadcast messages sent per second, Telegram's bot-wide limit
+BROADCAST_WORKERS = 8  # broadcast sends in flight at once
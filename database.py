@@ -1,237 +1,363 @@
-import sqlite3
-import json
-import logging
-from typing import Dict, List, Optional, Union
-from datetime import datetime
-
-logger = logging.getLogger(__name__)
-
-class DatabaseManager:
-    def __init__(self, db_path: str = "bot.db"):
-        """Initialize database connection"""
-        self.db_path = db_path
-        self.conn = None
-        self.cursor = None
-        self.connect()
-        self.create_tables()
-    
-    def connect(self):
-        """Connect to SQLite database"""
-        try:
-            self.conn = sqlite3.connect(self.db_path)
-            self.conn.row_factory = sqlite3.Row
-            self.cursor = self.conn.cursor()
-        except Exception as e:
-            logger.error(f"Error connecting to database: {e}")
-            raise
-    
-    def create_tables(self):
-        """Create necessary tables if they don't exist"""
-        try:
-            # Users table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    is_vip BOOLEAN DEFAULT FALSE,
-                    is_owner BOOLEAN DEFAULT FALSE,
-                    message_count INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            """)
-            
-            # Sessions table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS sessions (
-                    user_id INTEGER PRIMARY KEY,
-                    session_string TEXT,
-                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            # Copy jobs table
-            self.cursor.execute("""
-                CREATE TABLE IF NOT EXISTS copy_jobs (
-                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    source_channel TEXT,
-                    target_channel TEXT,
-                    start_msg_id INTEGER,
-                    end_msg_id INTEGER,
-                    status TEXT DEFAULT 'pending',
-                    progress INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users(user_id)
-                )
-            """)
-            
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error creating tables: {e}")
-            raise
-    
-    def add_user(self, user_id: int, username: Optional[str] = None, is_owner: bool = False):
-        """Add a new user to the database"""
-        try:
-            self.cursor.execute("""
-                INSERT OR IGNORE INTO users (user_id, username, is_owner)
-                VALUES (?, ?, ?)
-            """, (user_id, username, is_owner))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error adding user: {e}")
-            raise
-    
-    def get_user(self, user_id: int) -> Optional[Dict]:
-        """Get user details from database"""
-        try:
-            self.cursor.execute("SELECT * FROM users WHERE user_id = ?", (user_id,))
-            user = self.cursor.fetchone()
-            return dict(user) if user else None
-        except Exception as e:
-            logger.error(f"Error getting user: {e}")
-            return None
-    
-    def set_vip_status(self, user_id: int, is_vip: bool):
-        """Set user's VIP status"""
-        try:
-            self.cursor.execute("""
-                UPDATE users SET is_vip = ? WHERE user_id = ?
-            """, (is_vip, user_id))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error setting VIP status: {e}")
-            raise
-    
-    def get_all_vip_users(self) -> List[Dict]:
-        """Get all VIP users"""
-        try:
-            self.cursor.execute("SELECT * FROM users WHERE is_vip = TRUE")
-            users = self.cursor.fetchall()
-            return [dict(user) for user in users]
-        except Exception as e:
-            logger.error(f"Error getting VIP users: {e}")
-            return []
-    
-    def increment_message_count(self, user_id: int):
-        """Increment user's message count"""
-        try:
-            self.cursor.execute("""
-                UPDATE users SET message_count = message_count + 1
-                WHERE user_id = ?
-            """, (user_id,))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error incrementing message count: {e}")
-            raise
-    
-    def reset_message_count(self, user_id: int):
-        """Reset user's message count"""
-        try:
-            self.cursor.execute("""
-                UPDATE users SET message_count = 0
-                WHERE user_id = ?
-            """, (user_id,))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error resetting message count: {e}")
-            raise
-    
-    def get_user_stats(self, user_id: int) -> Dict:
-        """Get user statistics"""
-        try:
-            self.cursor.execute("""
-                SELECT user_id, username, is_vip, is_owner, message_count
-                FROM users WHERE user_id = ?
-            """, (user_id,))
-            user = self.cursor.fetchone()
-            
-            if not user:
-                return {
-                    'message_count': 0,
-                    'is_vip': False,
-                    'is_owner': False
-                }
-            
-            return dict(user)
-        except Exception as e:
-            logger.error(f"Error getting user stats: {e}")
-            return {
-                'message_count': 0,
-                'is_vip': False,
-                'is_owner': False
-            }
-    
-    def save_session(self, user_id: int, session_string: str):
-        """Save user's session string"""
-        try:
-            self.cursor.execute("""
-                INSERT OR REPLACE INTO sessions (user_id, session_string)
-                VALUES (?, ?)
-            """, (user_id, session_string))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error saving session: {e}")
-            raise
-    
-    def get_session(self, user_id: int) -> Optional[str]:
-        """Get user's session string"""
-        try:
-            self.cursor.execute("""
-                SELECT session_string FROM sessions WHERE user_id = ?
-            """, (user_id,))
-            result = self.cursor.fetchone()
-            return result['session_string'] if result else None
-        except Exception as e:
-            logger.error(f"Error getting session: {e}")
-            return None
-    
-    def create_copy_job(self, user_id: int, source_channel: str, target_channel: str,
-                       start_msg_id: int, end_msg_id: int) -> int:
-        """Create a new copy job"""
-        try:
-            self.cursor.execute("""
-                INSERT INTO copy_jobs (
-                    user_id, source_channel, target_channel,
-                    start_msg_id, end_msg_id
-                ) VALUES (?, ?, ?, ?, ?)
-            """, (user_id, source_channel, target_channel, start_msg_id, end_msg_id))
-            self.conn.commit()
-            return self.cursor.lastrowid
-        except Exception as e:
-            logger.error(f"Error creating copy job: {e}")
-            raise
-    
-    def update_job_status(self, job_id: int, status: str, progress: int = 0):
-        """Update copy job status and progress"""
-        try:
-            self.cursor.execute("""
-                UPDATE copy_jobs SET status = ?, progress = ?
-                WHERE job_id = ?
-            """, (status, progress, job_id))
-            self.conn.commit()
-        except Exception as e:
-            logger.error(f"Error updating job status: {e}")
-            raise
-    
-    def get_job_status(self, job_id: int) -> Optional[Dict]:
-        """Get copy job status"""
-        try:
-            self.cursor.execute("""
-                SELECT * FROM copy_jobs WHERE job_id = ?
-            """, (job_id,))
-            job = self.cursor.fetchone()
-            return dict(job) if job else None
-        except Exception as e:
-            logger.error(f"Error getting job status: {e}")
-            return None
-    
-    def close(self):
-        """Close database connection"""
-        try:
-            if self.conn:
-                self.conn.close()
-        except Exception as e:
-            logger.error(f"Error closing database connection: {e}")
+import sqlite3
+import json
+import logging
+import queue
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Union
+from datetime import datetime
+from config import DB_STATEMENT_CACHE_SIZE, DB_MMAP_SIZE, DB_CACHE_SIZE_KB, DB_COUNT_FLUSH_THRESHOLD, DB_READ_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Hot-path statements, kept as constants so every call hits the same cached prepared statement
+_SQL_GET_USER = "SELECT * FROM users WHERE user_id = ?"
+_SQL_GET_USER_STATS = "SELECT user_id, username, is_vip, is_owner, message_count FROM users WHERE user_id = ?"
+_SQL_ADD_MESSAGE_COUNT = "UPDATE users SET message_count = message_count + ? WHERE user_id = ?"
+_SQL_GET_SESSION = "SELECT session_string FROM sessions WHERE user_id = ?"
+
+class DatabaseManager:
+    def __init__(self, db_path: str = "bot.db"):
+        """Initialize database connection"""
+        self.db_path = db_path
+        self.conn = None
+        self.cursor = None
+        self.tuple_cursor = None
+        # Extra read-only connections for queries run from worker threads
+        self._read_pool = queue.Queue()
+        # user_id -> message count increments not yet written to the users table
+        self._pending_counts = {}
+        self.connect()
+        self.create_tables()
+    
+    def connect(self):
+        """Connect to SQLite database"""
+        try:
+            self.conn = self._open_connection()
+            self.cursor = self.conn.cursor()
+            # Plain tuples for lookups that only read a column or two, skipping sqlite3.Row
+            self.tuple_cursor = self.conn.cursor()
+            self.tuple_cursor.row_factory = None
+            for _ in range(DB_READ_POOL_SIZE):
+                self._read_pool.put(self._open_connection())
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            raise
+    
+    def _open_connection(self) -> sqlite3.Connection:
+        """Open a connection with the bot's row factory and PRAGMAs applied"""
+        # Reads may be offloaded to worker threads; sqlite is built serialized so sharing is safe
+        conn = sqlite3.connect(
+            self.db_path,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            check_same_thread=False
+        )
+        conn.row_factory = sqlite3.Row
+        # WAL lets stats reads run alongside writes; NORMAL skips the fsync on every commit
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        return conn
+    
+    @contextmanager
+    def acquire(self):
+        """Borrow a pooled read connection, so worker-thread reads don't contend on self.conn"""
+        conn = self._read_pool.get()
+        try:
+            yield conn
+        finally:
+            self._read_pool.put(conn)
+    
+    def q(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        """Execute a query on its own cursor, through the connection's LRU cache of compiled statements"""
+        return self.conn.execute(sql, params)
+    
+    def create_tables(self):
+        """Create necessary tables if they don't exist"""
+        try:
+            # Users table
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    is_vip BOOLEAN DEFAULT FALSE,
+                    is_owner BOOLEAN DEFAULT FALSE,
+                    message_count INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+
+            # Partial indexes: only VIP/owner rows are indexed, so lookups by role stay tiny
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_vip ON users(is_vip) WHERE is_vip = 1")
+            self.cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_owner ON users(is_owner) WHERE is_owner = 1")
+
+            # Running user totals, kept in sync by triggers so stats never scan users
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS counters (
+                    name TEXT PRIMARY KEY,
+                    value INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self.cursor.execute("""
+                INSERT OR IGNORE INTO counters (name, value)
+                SELECT 'users', COUNT(*) FROM users
+                UNION ALL SELECT 'vips', COALESCE(SUM(is_vip), 0) FROM users
+                UNION ALL SELECT 'owners', COALESCE(SUM(is_owner), 0) FROM users
+            """)
+            self.cursor.executescript("""
+                CREATE TRIGGER IF NOT EXISTS users_count_insert AFTER INSERT ON users BEGIN
+                    UPDATE counters SET value = value + 1 WHERE name = 'users';
+                    UPDATE counters SET value = value + (NEW.is_vip = 1) WHERE name = 'vips';
+                    UPDATE counters SET value = value + (NEW.is_owner = 1) WHERE name = 'owners';
+                END;
+                CREATE TRIGGER IF NOT EXISTS users_count_delete AFTER DELETE ON users BEGIN
+                    UPDATE counters SET value = value - 1 WHERE name = 'users';
+                    UPDATE counters SET value = value - (OLD.is_vip = 1) WHERE name = 'vips';
+                    UPDATE counters SET value = value - (OLD.is_owner = 1) WHERE name = 'owners';
+                END;
+                CREATE TRIGGER IF NOT EXISTS users_count_update AFTER UPDATE OF is_vip, is_owner ON users BEGIN
+                    UPDATE counters SET value = value + (NEW.is_vip = 1) - (OLD.is_vip = 1) WHERE name = 'vips';
+                    UPDATE counters SET value = value + (NEW.is_owner = 1) - (OLD.is_owner = 1) WHERE name = 'owners';
+                END;
+            """)
+            
+            # Sessions table
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    user_id INTEGER PRIMARY KEY,
+                    session_string TEXT,
+                    last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+            
+            # Copy jobs table
+            self.cursor.execute("""
+                CREATE TABLE IF NOT EXISTS copy_jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER,
+                    source_channel TEXT,
+                    target_channel TEXT,
+                    start_msg_id INTEGER,
+                    end_msg_id INTEGER,
+                    status TEXT DEFAULT 'pending',
+                    progress INTEGER DEFAULT 0,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (user_id) REFERENCES users(user_id)
+                )
+            """)
+            
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error creating tables: {e}")
+            raise
+    
+    def add_user(self, user_id: int, username: Optional[str] = None, is_owner: bool = False):
+        """Add a new user to the database"""
+        try:
+            self.q("""
+                INSERT OR IGNORE INTO users (user_id, username, is_owner)
+                VALUES (?, ?, ?)
+            """, (user_id, username, is_owner))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error adding user: {e}")
+            raise
+    
+    def get_user(self, user_id: int) -> Optional[Dict]:
+        """Get user details from database"""
+        try:
+            user = self.q(_SQL_GET_USER, (user_id,)).fetchone()
+            return self._with_pending_count(dict(user)) if user else None
+        except Exception as e:
+            logger.error(f"Error getting user: {e}")
+            return None
+    
+    def set_vip_status(self, user_id: int, is_vip: bool):
+        """Set user's VIP status"""
+        try:
+            self.q("""
+                UPDATE users SET is_vip = ? WHERE user_id = ?
+            """, (is_vip, user_id))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error setting VIP status: {e}")
+            raise
+    
+    def get_all_vip_users(self) -> List[Dict]:
+        """Get all VIP users"""
+        try:
+            users = self.q("SELECT * FROM users WHERE is_vip = 1").fetchall()
+            return [dict(user) for user in users]
+        except Exception as e:
+            logger.error(f"Error getting VIP users: {e}")
+            return []
+
+    def iter_vip_user_ids(self) -> Iterator[int]:
+        """Yield VIP user IDs one row at a time, for callers that don't need full records"""
+        for row in self.q("SELECT user_id FROM users WHERE is_vip = 1"):
+            yield row[0]
+
+    def iter_user_id_batches(self, batch_size: int, vip_only: bool = False) -> Iterator[List[int]]:
+        """Yield user IDs in lists of at most batch_size, holding one batch in memory at a time"""
+        cursor = self.q("SELECT user_id FROM users WHERE is_vip = 1" if vip_only else "SELECT user_id FROM users")
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [row[0] for row in rows]
+
+    def increment_message_count(self, user_id: int, count: int = 1):
+        """Increment user's message count, buffering writes until DB_COUNT_FLUSH_THRESHOLD"""
+        self._pending_counts[user_id] = self._pending_counts.get(user_id, 0) + count
+        if sum(self._pending_counts.values()) >= DB_COUNT_FLUSH_THRESHOLD:
+            self.flush_message_counts()
+    
+    def flush_message_counts(self):
+        """Write all buffered message count increments in one transaction"""
+        if not self._pending_counts:
+            return
+        pending, self._pending_counts = self._pending_counts, {}
+        try:
+            with self.conn:
+                self.conn.executemany(_SQL_ADD_MESSAGE_COUNT, [(count, user_id) for user_id, count in pending.items()])
+        except Exception as e:
+            logger.error(f"Error incrementing message count: {e}")
+            # Put the counts back, on top of any that arrived meanwhile, for the next flush
+            for user_id, count in pending.items():
+                self._pending_counts[user_id] = self._pending_counts.get(user_id, 0) + count
+            raise
+    
+    def _with_pending_count(self, user: Dict) -> Dict:
+        """Add any buffered increments to a user row read from the database"""
+        user['message_count'] = (user['message_count'] or 0) + self._pending_counts.get(user['user_id'], 0)
+        return user
+    
+    def reset_message_count(self, user_id: int):
+        """Reset user's message count"""
+        self._pending_counts.pop(user_id, None)
+        try:
+            self.q("""
+                UPDATE users SET message_count = 0
+                WHERE user_id = ?
+            """, (user_id,))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error resetting message count: {e}")
+            raise
+    
+    def reset_free_message_counts(self) -> int:
+        """Reset the message count of every non-VIP, non-owner user; returns how many users that was"""
+        # Only free users accumulate counts, so nothing buffered needs to survive
+        self._pending_counts.clear()
+        try:
+            with self.conn:
+                cursor = self.q("UPDATE users SET message_count = 0 WHERE is_vip = 0 AND is_owner = 0")
+            return cursor.rowcount
+        except Exception as e:
+            logger.error(f"Error resetting free users' message counts: {e}")
+            raise
+    
+    def get_user_stats(self, user_id: int) -> Dict:
+        """Get user statistics"""
+        try:
+            user = self.q(_SQL_GET_USER_STATS, (user_id,)).fetchone()
+            
+            if not user:
+                return {
+                    'message_count': 0,
+                    'is_vip': False,
+                    'is_owner': False
+                }
+            
+            return self._with_pending_count(dict(user))
+        except Exception as e:
+            logger.error(f"Error getting user stats: {e}")
+            return {
+                'message_count': 0,
+                'is_vip': False,
+                'is_owner': False
+            }
+    
+    def get_user_counts(self) -> Dict:
+        """Get total, VIP and owner user counts from the trigger-maintained counters"""
+        try:
+            with self.acquire() as conn:
+                counters = dict(conn.execute("SELECT name, value FROM counters").fetchall())
+            return {'total': counters['users'], 'vips': counters['vips'], 'owners': counters['owners']}
+        except Exception as e:
+            logger.error(f"Error getting user counts: {e}")
+            return {'total': 0, 'vips': 0, 'owners': 0}
+    
+    def save_session(self, user_id: int, session_string: str):
+        """Save user's session string"""
+        try:
+            self.q("""
+                INSERT OR REPLACE INTO sessions (user_id, session_string)
+                VALUES (?, ?)
+            """, (user_id, session_string))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving session: {e}")
+            raise
+    
+    def get_session(self, user_id: int) -> Optional[str]:
+        """Get user's session string"""
+        try:
+            result = self.tuple_cursor.execute(_SQL_GET_SESSION, (user_id,)).fetchone()
+            return result[0] if result else None
+        except Exception as e:
+            logger.error(f"Error getting session: {e}")
+            return None
+    
+    def create_copy_job(self, user_id: int, source_channel: str, target_channel: str,
+                       start_msg_id: int, end_msg_id: int) -> int:
+        """Create a new copy job"""
+        try:
+            cursor = self.q("""
+                INSERT INTO copy_jobs (
+                    user_id, source_channel, target_channel,
+                    start_msg_id, end_msg_id
+                ) VALUES (?, ?, ?, ?, ?)
+            """, (user_id, source_channel, target_channel, start_msg_id, end_msg_id))
+            self.conn.commit()
+            return cursor.lastrowid
+        except Exception as e:
+            logger.error(f"Error creating copy job: {e}")
+            raise
+    
+    def update_job_status(self, job_id: int, status: str, progress: int = 0):
+        """Update copy job status and progress"""
+        try:
+            self.q("""
+                UPDATE copy_jobs SET status = ?, progress = ?
+                WHERE job_id = ?
+            """, (status, progress, job_id))
+            self.conn.commit()
+        except Exception as e:
+            logger.error(f"Error updating job status: {e}")
+            raise
+    
+    def get_job_status(self, job_id: int) -> Optional[Dict]:
+        """Get copy job status"""
+        try:
+            job = self.q("""
+                SELECT * FROM copy_jobs WHERE job_id = ?
+            """, (job_id,)).fetchone()
+            return dict(job) if job else None
+        except Exception as e:
+            logger.error(f"Error getting job status: {e}")
+            return None
+    
+    def close(self):
+        """Close database connection"""
+        try:
+            if self.conn:
+                self.flush_message_counts()
+                self.conn.close()
+            while not self._read_pool.empty():
+                self._read_pool.get_nowait().close()
+        except Exception as e:
+            logger.error(f"Error closing database connection: {e}")
             raise 
\ No newline at end of file
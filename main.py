@@ -1,16 +1,21 @@
 import asyncio
+import itertools
 import logging
 import time
-import os
 import re
+import tempfile
 from pyrogram import Client, filters
 from pyrogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
-from config import API_ID, API_HASH, BOT_TOKEN, LOG_LEVEL, LOG_FORMAT
+from pyrogram.errors import PeerIdInvalid, Unauthorized
+from config import (
+    API_ID, API_HASH, BOT_TOKEN, LOG_LEVEL, LOG_FORMAT, PROGRESS_EDIT_INTERVAL, PERSONAL_COPY_WORKERS,
+    BROADCAST_BATCH_SIZE, BROADCAST_WORKERS, MAX_RETRIES, MEDIA_SPOOL_SIZE, MAX_CONCURRENT_COPIES
+)
 from session_handler import SessionHandler
 from user_manager import UserManager
 from message_handler import MessageHandler
 from button_handler import ButtonHandler
-from utils import validate_phone_number, parse_message_range
+from utils import validate_phone_number, parse_message_range, RateLimiter, ThrottledEditor, answer_in_background, retry_flood_wait
 
 # Configure logging
 logging.basicConfig(level=getattr(logging, LOG_LEVEL), format=LOG_FORMAT)
@@ -25,9 +30,71 @@ button_handler = ButtonHandler(session_handler, user_manager, message_handler)
 # Create bot client
 app = Client("copier_bot", api_id=API_ID, api_hash=API_HASH, bot_token=BOT_TOKEN)
 
+# Broadcast sends share one bucket so they stay under Telegram's bot-wide message rate
+broadcast_limiter = RateLimiter(BROADCAST_BATCH_SIZE)
+
+# Copy jobs started from the "start_copy" button: keep references so tasks aren't garbage
+# collected, cap how many run at once, and allow one job per user
+copy_tasks = set()
+copy_semaphore = asyncio.Semaphore(MAX_CONCURRENT_COPIES)
+active_copy_users = set()
+
+# Static keyboards, built once
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
+RANGE_SET_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🚀 Start Copying", callback_data="start_copy")],
+    [InlineKeyboardButton("🔄 Reset Copy Parameters", callback_data="reset_copy")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")],
+])
+RANGE_SELECTION_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Copy all channel", callback_data="range_all")],
+    [InlineKeyboardButton("🔢 Set start", callback_data="range_set_start")],
+    [InlineKeyboardButton("🔢 Set end", callback_data="range_set_end")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")],
+])
+UPGRADE_VIP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⭐ Upgrade to VIP", callback_data="show_vip_upgrade")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+])
+
+# Telegram message links: https://t.me/c/<id>/<msg>[-<msg>] and https://t.me/<username>/<msg>[-<msg>]
+MSG_ID_RE = re.compile(r'/([0-9]+)$')
+LINK_PRIVATE_RE = re.compile(r"https?://t\.me/c/(\d+)/(\d+)(?:-(\d+))?")
+LINK_PUBLIC_RE = re.compile(r"https?://t\.me/([\w_]+)/([0-9]+)(?:-([0-9]+))?")
+
+# Most message IDs a single messages.getMessages call accepts
+GET_MESSAGES_BATCH_SIZE = 200
+
+# user_id -> the client whose peer cache was last filled from get_dialogs
+_peers_warmed = {}
+
+# Accepted channel formats, listed when setting a channel fails
+TARGET_CHANNEL_FORMATS = (
+    "Accepted formats:\n"
+    "• Channel username: @channelname\n"
+    "• Channel link: https://t.me/channelname\n"
+    "• Channel ID: -1001234567890\n"
+    "• Invitation link: https://t.me/+AbCdEfGhIj\n"
+)
+SOURCE_CHANNEL_FORMATS = (
+    TARGET_CHANNEL_FORMATS
+    + "• Message link: https://t.me/c/123456789/1 or https://t.me/channelname/1\n"
+)
+
+class MessageCallbackAdapter:
+    """Lets a text message stand in for a CallbackQuery when showing a menu: edits become replies."""
+    __slots__ = ("from_user", "edit_message_text")
+
+    def __init__(self, message: Message):
+        self.from_user = message.from_user
+        self.edit_message_text = message.reply
+
+    async def answer(self, *args, **kwargs):
+        pass
+
 def extract_message_id_from_link(link):
     """Extract the message ID from a Telegram message link."""
-    match = re.search(r'/([0-9]+)$', link)
+    match = MSG_ID_RE.search(link)
     if match:
         return int(match.group(1))
     return None
@@ -54,12 +121,7 @@ async def start_command(client: Client, message: Message):
         })
         
         # Show main menu
-        from pyrogram.types import CallbackQuery
-        fake_callback = type('CallbackQuery', (), {
-            'from_user': message.from_user,
-            'edit_message_text': message.reply,
-            'answer': lambda: None
-        })()
+        fake_callback = MessageCallbackAdapter(message)
         
         await button_handler.show_main_menu(fake_callback)
         
@@ -85,156 +147,224 @@ async def stop_command(client: Client, message: Message):
 # --- Button-based message range selection ---
 async def show_range_selection_menu(callback_query):
     """Show buttons for range selection: Copy all, Set start, Set end"""
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📋 Copy all channel", callback_data="range_all")],
-        [InlineKeyboardButton("🔢 Set start", callback_data="range_set_start")],
-        [InlineKeyboardButton("🔢 Set end", callback_data="range_set_end")],
-        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")],
-    ])
     await callback_query.edit_message_text(
         "Select message range to copy:",
-        reply_markup=keyboard
+        reply_markup=RANGE_SELECTION_KEYBOARD
     )
 
 async def show_range_selection_menu_for_message(message):
     """Show range selection menu as a new message (for use in text_handler)."""
-    keyboard = InlineKeyboardMarkup([
-        [InlineKeyboardButton("📋 Copy all channel", callback_data="range_all")],
-        [InlineKeyboardButton("🔢 Set start", callback_data="range_set_start")],
-        [InlineKeyboardButton("🔢 Set end", callback_data="range_set_end")],
-        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")],
-    ])
     await message.reply(
         "Select message range to copy:",
-        reply_markup=keyboard
+        reply_markup=RANGE_SELECTION_KEYBOARD
     )
 
+async def broadcast_text(user_ids, text):
+    """Send text to every user ID with BROADCAST_WORKERS concurrent senders; returns how many were delivered."""
+    queue = asyncio.Queue(maxsize=BROADCAST_WORKERS * 2)
+    count = 0
+    async def send_worker():
+        nonlocal count
+        while (uid := await queue.get()) is not None:
+            await broadcast_limiter.acquire()
+            try:
+                await retry_flood_wait(app.send_message, uid, text, attempts=MAX_RETRIES)
+                count += 1
+            except Exception as e:
+                logger.warning(f"Failed to send to {uid}: {e}")
+    workers = [asyncio.create_task(send_worker()) for _ in range(BROADCAST_WORKERS)]
+    try:
+        for uid in user_ids:
+            await queue.put(uid)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return count
+
+def media_file_name(msg):
+    """File name to send a message's media under: its own name, else <type>_<id> plus a guessed extension."""
+    media = getattr(msg, msg.media.value, None)
+    file_name = getattr(media, "file_name", None)
+    if file_name:
+        return file_name
+    extension = ".jpg" if msg.photo else app.guess_extension(getattr(media, "mime_type", None) or "") or ""
+    return f"{msg.media.value}_{msg.id}{extension}"
+
+async def warm_peer_cache(user_id, client, refresh=False):
+    """Load the user's dialogs once per client so peers resolve from Pyrogram's cache."""
+    if not refresh and _peers_warmed.get(user_id) is client:
+        return
+    try:
+        async for dialog in client.get_dialogs():
+            pass
+        _peers_warmed[user_id] = client
+        logger.info(f"Loaded dialogs for user {user_id}")
+    except Exception as e:
+        logger.warning(f"Could not load dialogs: {e}")
+
+async def first_history_message_id(client, channel_id, **kwargs):
+    """ID of the first message get_chat_history returns for these arguments, or None."""
+    async for message in client.get_chat_history(channel_id, limit=1, **kwargs):
+        return message.id
+    return None
+
 async def get_channel_message_id_range(client, channel_id):
-    """Fetch the minimum and maximum message IDs in a channel."""
-    min_id = None
-    max_id = None
-    # Get the latest message (max_id)
-    async for message in client.get_chat_history(channel_id, limit=1):
-        max_id = message.id
-    # Get the oldest message (min_id) by iterating to the end
-    async for message in client.get_chat_history(channel_id):
-        min_id = message.id  # This will end up as the oldest
+    """Fetch the minimum and maximum message IDs in a channel with one history request each."""
+    min_id, max_id = await asyncio.gather(
+        # offset_id=1 with offset=-1 returns the oldest message at or after ID 1
+        first_history_message_id(client, channel_id, offset_id=1, offset=-1),
+        # Default order is newest first
+        first_history_message_id(client, channel_id),
+    )
     return min_id, max_id
 
-@app.on_callback_query()
-async def callback_handler(client: Client, callback_query: CallbackQuery):
-    """Handle all callback queries, including range selection and copy start."""
-    data = callback_query.data
+async def handle_range_all(callback_query: CallbackQuery):
+    """Set the range to the whole source channel."""
     user_id = callback_query.from_user.id
     session = session_handler.get_user_session(user_id)
-    # --- Range selection logic ---
-    if data == "set_range":
-        await show_range_selection_menu(callback_query)
+    # Get the last message ID from the source channel
+    source_id = session.get('source_channel')
+    if not source_id:
+        await callback_query.edit_message_text("❌ Please set the source channel first.")
         return
-    if data == "range_all":
-        # Get the last message ID from the source channel
-        source_id = session.get('source_channel')
-        if not source_id:
-            await callback_query.edit_message_text("❌ Please set the source channel first.")
-            return
-        # Get user client
-        client = await session_handler.get_user_client(user_id)
-        if not client:
-            await callback_query.edit_message_text("❌ No active session found. Please create a session first.")
-            return
-        # Fetch the last message from the source channel
-        try:
-            last_message = await client.get_history(source_id, limit=1)
-            if last_message:
-                last_msg_id = last_message[0].id
-            else:
-                last_msg_id = 1
-        except Exception as e:
-            logger.error(f"Error fetching last message: {e}")
-            await callback_query.edit_message_text(
+    # Get user client
+    client = await session_handler.get_user_client(user_id, refresh=True)
+    if not client:
+        await callback_query.edit_message_text("❌ No active session found. Please create a session first.")
+        return
+    # Fetch the first and last message IDs of the source channel
+    try:
+        first_msg_id, last_msg_id = await get_channel_message_id_range(client, source_id)
+        first_msg_id = first_msg_id or 1
+        last_msg_id = last_msg_id or first_msg_id
+    except Exception as e:
+        logger.error(f"Error fetching last message: {e}")
+        await asyncio.gather(
+            session_handler.update_user_session_async(user_id, {'state': 'awaiting_range_end_link', 'start_msg_id': 1}),
+            callback_query.edit_message_text(
                 "We've set up everything for you! 😊\n\nJust send the link or ID of the last message in the source channel to finish setup. (The start message is already set to 1 for you.)")
-            session_handler.update_user_session(user_id, {'state': 'awaiting_range_end_link', 'start_msg_id': 1})
-            return
-        session_handler.update_user_session(user_id, {
-            'start_msg_id': 1,
+        )
+        return
+    keyboard = RANGE_SET_KEYBOARD
+    await asyncio.gather(
+        session_handler.update_user_session_async(user_id, {
+            'start_msg_id': first_msg_id,
             'end_msg_id': last_msg_id,
             'state': 'main_menu'
-        })
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🚀 Start Copying", callback_data="start_copy")],
-            [InlineKeyboardButton("🔄 Reset Copy Parameters", callback_data="reset_copy")],
-            [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")],
-        ])
-        await callback_query.edit_message_text(
-            f"Message range set to all channel!\nRange: 1 - {last_msg_id}",
+        }),
+        callback_query.edit_message_text(
+            f"Message range set to all channel!\nRange: {first_msg_id} - {last_msg_id}",
             reply_markup=keyboard
         )
-        return
-    if data == "range_set_start":
-        session_handler.update_user_session(user_id, {'state': 'awaiting_range_start_link'})
-        await callback_query.edit_message_text(
+    )
+
+async def handle_range_set_start(callback_query: CallbackQuery):
+    """Ask for the link of the first message to copy."""
+    user_id = callback_query.from_user.id
+    await asyncio.gather(
+        session_handler.update_user_session_async(user_id, {'state': 'awaiting_range_start_link'}),
+        callback_query.edit_message_text(
             "Send the link of the <b>start message</b> (forward or copy link from Telegram):",
         )
-        return
-    if data == "range_set_end":
-        session_handler.update_user_session(user_id, {'state': 'awaiting_range_end_link'})
-        await callback_query.edit_message_text(
+    )
+
+async def handle_range_set_end(callback_query: CallbackQuery):
+    """Ask for the link of the last message to copy."""
+    user_id = callback_query.from_user.id
+    await asyncio.gather(
+        session_handler.update_user_session_async(user_id, {'state': 'awaiting_range_end_link'}),
+        callback_query.edit_message_text(
             "Send the link of the <b>end message</b> (forward or copy link from Telegram):",
         )
+    )
+
+async def handle_start_copy(callback_query: CallbackQuery):
+    """Start the copy job for the configured source, target and range in the background."""
+    user_id = callback_query.from_user.id
+    session = session_handler.get_user_session(user_id)
+    source_id = session.get('source_channel')
+    target_id = session.get('target_channel')
+    start_id = session.get('start_msg_id')
+    end_id = session.get('end_msg_id')
+    if not (source_id and target_id and start_id is not None and end_id is not None):
+        await callback_query.edit_message_text("❌ Please set source, target, and message range first.")
         return
-    if data == "show_vip_upgrade":
-        await button_handler.show_vip_upgrade(callback_query)
+    if user_id in active_copy_users:
+        await callback_query.message.reply("⏳ A copy operation is already running. Please wait for it to finish.")
         return
-    # --- Start copy logic ---
-    if data == "start_copy":
-        try:
-            # Always use detailed monitor system
-            source_id = session.get('source_channel')
-            target_id = session.get('target_channel')
-            start_id = session.get('start_msg_id')
-            end_id = session.get('end_msg_id')
-            if not (source_id and target_id and start_id and end_id):
-                await callback_query.edit_message_text("❌ Please set source, target, and message range first.")
-                return
-            # Show initial status message and pass it to copy_messages for progress updates
-            status_msg = await callback_query.message.reply("📥 Starting copy...")
+    active_copy_users.add(user_id)
+    task = asyncio.create_task(run_copy(callback_query, source_id, target_id, start_id, end_id))
+    copy_tasks.add(task)
+    task.add_done_callback(copy_tasks.discard)
+
+async def run_copy(callback_query: CallbackQuery, source_id, target_id, start_id, end_id):
+    """Run one copy job once a concurrency slot is free."""
+    user_id = callback_query.from_user.id
+    try:
+        # Show initial status message and pass it to copy_messages for progress updates
+        status_msg = await callback_query.message.reply("📥 Starting copy...")
+        async with copy_semaphore:
             success, result = await message_handler.copy_messages(
                 user_id, source_id, target_id, start_id, end_id, status_message=status_msg
             )
-            if success:
-                await status_msg.reply(f"✅ Copy completed!\n\n{result}")
-            else:
-                await status_msg.reply(f"❌ Copy failed!\n\n{result}")
-        except Exception as e:
-            logger.error(f"Error in start_copy logic: {e}")
-            try:
-                await callback_query.message.reply(f"❌ An error occurred: {str(e)}")
-            except Exception:
-                pass
-        finally:
-            try:
-                await button_handler.show_main_menu(callback_query)
-            except Exception as menu_error:
-                logger.error(f"Error showing main menu: {menu_error}")
+        if success:
+            await status_msg.reply(f"✅ Copy completed!\n\n{result}")
+        else:
+            await status_msg.reply(f"❌ Copy failed!\n\n{result}")
+    except Exception as e:
+        logger.error(f"Error in start_copy logic: {e}")
+        try:
+            await callback_query.message.reply(f"❌ An error occurred: {str(e)}")
+        except Exception:
+            pass
+    finally:
+        active_copy_users.discard(user_id)
+        try:
+            await button_handler.show_main_menu(callback_query)
+        except Exception as menu_error:
+            logger.error(f"Error showing main menu: {menu_error}")
+
+# Callbacks handled here before falling back to button_handler
+CALLBACK_HANDLERS = {
+    "set_range": show_range_selection_menu,
+    "range_all": handle_range_all,
+    "range_set_start": handle_range_set_start,
+    "range_set_end": handle_range_set_end,
+    "show_vip_upgrade": button_handler.show_vip_upgrade,
+    "start_copy": handle_start_copy,
+}
+
+@app.on_callback_query()
+async def callback_handler(client: Client, callback_query: CallbackQuery):
+    """Handle all callback queries, including range selection and copy start."""
+    handler = CALLBACK_HANDLERS.get(callback_query.data)
+    if handler is None:
+        # button_handler answers the query itself
+        await button_handler.handle_callback(callback_query)
         return
-    # Fallback to button_handler for other callbacks
-    await button_handler.handle_callback(callback_query)
+    # Acknowledge the press while the handler runs
+    answer_in_background(callback_query)
+    await handler(callback_query)
 
-@app.on_message(filters.text & filters.private)
+# Commands have their own handlers; in the same group only the first matching handler
+# runs, so they must not match here
+@app.on_message(filters.text & filters.private & ~filters.command(["start", "stop", "reset"]))
 async def text_handler(client: Client, message: Message):
     try:
         user_id = message.from_user.id
         session = session_handler.get_user_session(user_id)
         
-        # Reset cancellation flag at the start of any copy operation
-        session_handler.update_user_session(user_id, {'is_cancelled': False})
+        # Reset cancellation flag at the start of any copy operation; most messages
+        # find it already clear, and then there is nothing to write
+        if session.get('is_cancelled'):
+            session_handler.update_user_session(user_id, {'is_cancelled': False})
         
         state = session.get('state', 'main_menu')
         text = message.text.strip()
         logger.info(f"Text message from user {user_id}, state: {state}, text: {text}")
-        # Prevent handling /reset command here
-        if text.startswith("/reset"):
-            return
         # --- Admin input states ---
         if state == 'awaiting_free_limit':
             try:
@@ -246,15 +376,8 @@ async def text_handler(client: Client, message: Message):
                 assert new_limit > 0
                 user_manager.save_free_limit(new_limit)
                 # Reset message count for all free users
-                from database import DatabaseManager
-                db = DatabaseManager()
-                users = db.cursor.execute('SELECT user_id, is_vip, is_owner FROM users').fetchall()
-                reset_count = 0
-                for row in users:
-                    user_id, is_vip, is_owner = row
-                    if not is_vip and not is_owner:
-                        db.reset_message_count(user_id)
-                        reset_count += 1
+                reset_count = user_manager.db.reset_free_message_counts()
+                user_manager.invalidate_user_cache()
                 await message.reply(f"✅ Free user daily message limit set to {new_limit}.\nAll free users' daily usage has been reset ({reset_count} users).")
                 session_handler.update_user_session(user_id, {'state': 'main_menu'})
             except Exception:
@@ -266,18 +389,9 @@ async def text_handler(client: Client, message: Message):
                 if not user_manager.is_owner(owner_id):
                     await message.reply("❌ You are not authorized to perform this action.")
                     return
-                from database import DatabaseManager
-                db = DatabaseManager()
-                users = db.cursor.execute('SELECT user_id FROM users').fetchall()
-                count = 0
-                for row in users:
-                    try:
-                        logger.info(f"Broadcasting to user {row[0]}")
-                        await app.send_message(row[0], text)
-                        count += 1
-                    except Exception as e:
-                        logger.warning(f"Failed to send to {row[0]}: {e}")
-                        continue
+                db = user_manager.db
+                user_ids = itertools.chain.from_iterable(db.iter_user_id_batches(BROADCAST_BATCH_SIZE))
+                count = await broadcast_text(user_ids, text)
                 await message.reply(f"✅ Broadcast sent to {count} users.")
                 session_handler.update_user_session(user_id, {'state': 'main_menu'})
             except Exception as e:
@@ -292,12 +406,7 @@ async def text_handler(client: Client, message: Message):
                     raise ValueError
                 session_handler.update_user_session(user_id, {'start_msg_id': start_id, 'state': 'main_menu'})
                 await message.reply(f"Start message ID set to {start_id}.")
-                from pyrogram.types import CallbackQuery
-                fake_callback = type('CallbackQuery', (), {
-                    'from_user': message.from_user,
-                    'edit_message_text': message.reply,
-                    'answer': lambda: None
-                })()
+                fake_callback = MessageCallbackAdapter(message)
                 await button_handler.show_main_menu(fake_callback)
             except Exception:
                 await message.reply("Invalid start message ID. Please send a positive integer.")
@@ -309,12 +418,7 @@ async def text_handler(client: Client, message: Message):
                     raise ValueError
                 session_handler.update_user_session(user_id, {'end_msg_id': end_id, 'state': 'main_menu'})
                 await message.reply(f"End message ID set to {end_id}.")
-                from pyrogram.types import CallbackQuery
-                fake_callback = type('CallbackQuery', (), {
-                    'from_user': message.from_user,
-                    'edit_message_text': message.reply,
-                    'answer': lambda: None
-                })()
+                fake_callback = MessageCallbackAdapter(message)
                 await button_handler.show_main_menu(fake_callback)
             except Exception:
                 await message.reply("Invalid end message ID. Please send a positive integer.")
@@ -324,12 +428,7 @@ async def text_handler(client: Client, message: Message):
             if msg_id:
                 session_handler.update_user_session(user_id, {'start_msg_id': msg_id, 'state': 'main_menu'})
                 await message.reply(f"Start message ID set to {msg_id}.")
-                from pyrogram.types import CallbackQuery
-                fake_callback = type('CallbackQuery', (), {
-                    'from_user': message.from_user,
-                    'edit_message_text': message.reply,
-                    'answer': lambda: None
-                })()
+                fake_callback = MessageCallbackAdapter(message)
                 await button_handler.show_main_menu(fake_callback)
             else:
                 await message.reply("Invalid link. Please send a valid Telegram message link.")
@@ -339,59 +438,33 @@ async def text_handler(client: Client, message: Message):
             if msg_id:
                 session_handler.update_user_session(user_id, {'end_msg_id': msg_id, 'state': 'main_menu'})
                 await message.reply(f"End message ID set to {msg_id}.")
-                from pyrogram.types import CallbackQuery
-                fake_callback = type('CallbackQuery', (), {
-                    'from_user': message.from_user,
-                    'edit_message_text': message.reply,
-                    'answer': lambda: None
-                })()
+                fake_callback = MessageCallbackAdapter(message)
                 await button_handler.show_main_menu(fake_callback)
             else:
                 await message.reply("Invalid link. Please send a valid Telegram message link.")
             return
-        if state == 'awaiting_phone':
-            await handle_phone_input(message, text)
-        elif state == 'awaiting_code':
-            await handle_code_input(message, text)
-        elif state == 'awaiting_password':
-            await handle_password_input(message, text)
-        elif state == 'awaiting_session_string':
-            await handle_session_string_input(message, text)
-        elif state == 'awaiting_source_channel':
-            await handle_source_channel_input(message, text)
-        elif state == 'awaiting_target_channel':
-            await handle_target_channel_input(message, text)
-        elif state == 'awaiting_message_range':
-            await handle_message_range_input(message, text)
-        elif state == 'awaiting_vip_promotion':
-            await handle_vip_promotion_input(message, text)
-        elif state == 'awaiting_vip_demotion':
-            await handle_vip_demotion_input(message, text)
+        handler = STATE_HANDLERS.get(state)
+        if handler is not None:
+            await handler(message, text)
         elif state == 'awaiting_personal_copy_link':
+            user_client = None
             try:
                 # Check free user message limit before starting
                 stats = user_manager.get_user_stats(user_id)
-                if not (stats['is_owner'] or stats['is_vip']) and stats['message_count'] >= stats['message_limit']:
-                    from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                    keyboard = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⭐ Upgrade to VIP", callback_data="show_vip_upgrade")],
-                        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-                    ])
+                is_privileged = stats['is_owner'] or stats['is_vip']
+                if stats['message_limit'] is not None and stats['message_count'] >= stats['message_limit']:
+                    keyboard = UPGRADE_VIP_KEYBOARD
                     await message.reply(
                         "❌ You have reached your daily free message limit. Upgrade to VIP for unlimited copying!",
                         reply_markup=keyboard
                     )
                     session_handler.update_user_session(user_id, {'state': 'main_menu'})
                     return
-                import re
-                from pyrogram.errors import PeerIdInvalid
                 text = text.strip()
-                link_pattern_private = r"https?://t\.me/c/(\d+)/(\d+)(?:-(\d+))?"
-                link_pattern_public = r"https?://t\.me/([\w_]+)/([0-9]+)(?:-([0-9]+))?"
-                match = re.match(link_pattern_private, text)
+                match = LINK_PRIVATE_RE.match(text)
                 is_public = False
                 if not match:
-                    match = re.match(link_pattern_public, text)
+                    match = LINK_PUBLIC_RE.match(text)
                     is_public = True if match else False
                 if not match:
                     await message.reply(f"❌ Invalid link format.\nPlease send a valid Telegram message link or range.\nExample:\n- https://t.me/c/2434759780/6\n- https://t.me/channelname/6\n- https://t.me/c/2434759780/6-10\n- https://t.me/channelname/6-10")
@@ -404,170 +477,216 @@ async def text_handler(client: Client, message: Message):
                     channel = int('-100' + match.group(1))
                     start_id = int(match.group(2))
                     end_id = int(match.group(3)) if match.group(3) else start_id
-                user_client = await session_handler.get_user_client(user_id)
+                user_client = await session_handler.get_user_client(user_id, refresh=True)
                 if not user_client:
                     await message.reply("❌ No active session found. Please create a session first.")
                     return
-                # Try to cache all peers by calling get_dialogs
-                try:
-                    async for dialog in user_client.get_dialogs():
-                        pass
-                    logger.info(f"Loaded dialogs for user {user_id}")
-                except Exception as e:
-                    logger.warning(f"Could not load dialogs: {e}")
+                session_handler.pin_client(user_id)
+                await warm_peer_cache(user_id, user_client)
                 copied = 0
                 failed = 0
                 total = end_id - start_id + 1
                 status_msg = await message.reply(f"📝 Starting copy...\nTotal: {total} messages")
                 
-                # Create a temporary directory for large files
-                temp_dir = "temp_downloads"
-                if not os.path.exists(temp_dir):
-                    os.makedirs(temp_dir)
+                # Per-message status edits are best effort
+                edit_status = ThrottledEditor(status_msg, PROGRESS_EDIT_INTERVAL)
                 
-                # Maximum file size for in-memory handling (100MB)
-                MAX_MEMORY_SIZE = 100 * 1024 * 1024  # 100MB in bytes
+                # Resolve the source peer once, so per-message lookups hit the peer cache
+                try:
+                    await user_client.get_chat(channel)
+                except PeerIdInvalid:
+                    # The dialogs may have been loaded before the user joined this chat: reload them once
+                    await warm_peer_cache(user_id, user_client, refresh=True)
+                    try:
+                        await user_client.get_chat(channel)
+                    except Exception as e:
+                        logger.warning(f"get_chat failed for {channel}: {e}")
+                except Exception as e:
+                    logger.warning(f"get_chat failed for {channel}: {e}")
                 
-                for idx, msg_id in enumerate(range(start_id, end_id + 1), 1):
-                    # Check if operation was cancelled
-                    session = session_handler.get_user_session(user_id)
-                    if session.get('is_cancelled'):
-                        await status_msg.edit_text("🛑 Copy operation cancelled by user.")
-                        break
-                    
-                    msg = None
+                # Messages are fetched GET_MESSAGES_BATCH_SIZE IDs per request; the first worker to need a
+                # batch starts the request and the others await the same future. A batch is dropped once
+                # every ID in it has been handed out, and is never requested again.
+                message_batches = {}
+                finished_batches = set()
+                async def fetch_batch(ids):
+                    # Every requested ID gets an entry, so missing messages are consumed like found ones
+                    batch = dict.fromkeys(ids)
+                    batch.update((msg.id, msg) for msg in await user_client.get_messages(channel, ids) if msg)
+                    return batch
+                async def get_message(msg_id):
+                    key = (msg_id - start_id) // GET_MESSAGES_BATCH_SIZE
+                    if key in finished_batches:
+                        # Only a repeated lookup gets here: ask for this ID alone
+                        return await user_client.get_messages(channel, msg_id)
+                    batch = message_batches.get(key)
+                    if batch is None:
+                        first_id = start_id + key * GET_MESSAGES_BATCH_SIZE
+                        ids = list(range(first_id, min(first_id + GET_MESSAGES_BATCH_SIZE, end_id + 1)))
+                        batch = message_batches[key] = asyncio.ensure_future(fetch_batch(ids))
                     try:
-                        # Try get_chat with both numeric and username if possible
-                        try:
-                            await user_client.get_chat(channel)
-                        except Exception as e:
-                            logger.warning(f"get_chat failed for {channel}: {e}")
-                        try:
-                            msg = await user_client.get_messages(channel, msg_id)
-                        except PeerIdInvalid:
-                            await status_msg.edit_text(
-                                "❌ Telegram API error: Peer ID invalid.\n\n" 
-                                "Your account is a member, but Telegram sometimes restricts access by link if the peer is not cached.\n" 
-                                "We tried to load all dialogs and resolve the peer, but Telegram still blocks access.\n\n" 
-                                "If this works in another bot, please share details for further debugging.")
-                            failed += 1
-                            continue
+                        messages = await batch
+                    except Exception:
+                        # e.g. PeerIdInvalid: ask for this ID alone so the error is reported per message
+                        return await user_client.get_messages(channel, msg_id)
+                    msg = messages.pop(msg_id, None)
+                    if not messages:
+                        message_batches.pop(key, None)
+                        finished_batches.add(key)
+                    return msg
+                
+                async def fetch_one(idx, msg_id):
+                    """Get one message and download its media. Returns (msg, file), or None if it failed."""
+                    nonlocal failed, cancelled, unauthorized
+                    try:
+                        msg = await get_message(msg_id)
+                    except Unauthorized as e:
+                        # The session was revoked or expired: stop the whole copy instead of failing each message
+                        logger.warning(f"Session for user {user_id} is no longer authorized: {e}")
+                        unauthorized = cancelled = True
+                        return None
+                    except PeerIdInvalid:
+                        await edit_status(
+                            "❌ Telegram API error: Peer ID invalid.\n\n" 
+                            "Your account is a member, but Telegram sometimes restricts access by link if the peer is not cached.\n" 
+                            "We tried to load all dialogs and resolve the peer, but Telegram still blocks access.\n\n" 
+                            "If this works in another bot, please share details for further debugging.")
+                        failed += 1
+                        return None
                     except Exception as e:
                         failed += 1
-                        await status_msg.edit_text(f"Failed to copy message {msg_id}: {e}\nProgress: {idx}/{total}")
-                        continue
+                        await edit_status(f"Failed to copy message {msg_id}: {e}\nProgress: {idx}/{total}")
+                        return None
                     if not msg:
-                        await status_msg.edit_text(f"Message {msg_id} not found or inaccessible.\nProgress: {idx}/{total}")
+                        await edit_status(f"Message {msg_id} not found or inaccessible.\nProgress: {idx}/{total}")
                         failed += 1
-                        continue
+                        return None
+                    file = None
+                    if msg.media:
+                        # Stream into a spooled file: small media stays in RAM, anything over
+                        # MEDIA_SPOOL_SIZE spills to an anonymous temp file that vanishes on close
+                        file = tempfile.SpooledTemporaryFile(max_size=MEDIA_SPOOL_SIZE)
+                        try:
+                            async for chunk in user_client.stream_media(msg):
+                                file.write(chunk)
+                            file.seek(0)
+                        except Exception as e:
+                            logger.error(f"Error processing media message {msg_id}: {e}")
+                            file.close()
+                            failed += 1
+                            return None
+                    return msg, file
+                
+                async def send_one(idx, msg_id, msg, file):
+                    """Send one fetched message to the user and report it in the status message."""
+                    nonlocal copied, failed
                     details = [
                         f"📝 Processing message {msg_id} ({idx}/{total})...",
                         f"📅 Date: {msg.date.strftime('%Y-%m-%d %H:%M:%S') if hasattr(msg, 'date') else ''}"
                     ]
                     if msg.media:
                         try:
-                            # Get file size if available
-                            file_size = 0
-                            if hasattr(msg, 'video') and msg.video:
-                                file_size = msg.video.file_size
-                            elif hasattr(msg, 'document') and msg.document:
-                                file_size = msg.document.file_size
-                            elif hasattr(msg, 'photo') and msg.photo:
-                                file_size = msg.photo.file_size
-                            elif hasattr(msg, 'audio') and msg.audio:
-                                file_size = msg.audio.file_size
-                            
-                            # Choose download method based on file size
-                            if file_size > MAX_MEMORY_SIZE:
-                                # For large files, use temporary file
-                                temp_file = os.path.join(temp_dir, f"temp_{msg_id}_{int(time.time())}")
-                                file = await user_client.download_media(msg, file_name=temp_file)
-                                if file:
-                                    try:
-                                        await client.send_document(user_id, file, caption=msg.caption if msg.caption else None)
-                                        # Clean up the temporary file immediately after sending
-                                        try:
-                                            os.remove(file)
-                                            logger.info(f"Successfully deleted temporary file: {file}")
-                                        except Exception as e:
-                                            logger.warning(f"Error deleting temporary file {file}: {e}")
-                                    except Exception as e:
-                                        logger.error(f"Error sending file: {e}")
-                                        failed += 1
-                                        # Try to clean up the file if it exists
-                                        try:
-                                            if os.path.exists(file):
-                                                os.remove(file)
-                                        except Exception as cleanup_error:
-                                            logger.warning(f"Error cleaning up file after error: {cleanup_error}")
-                            else:
-                                # For smaller files, use in-memory download
-                                file = await user_client.download_media(msg, in_memory=True)
-                                if file:
-                                    await client.send_document(user_id, file, caption=msg.caption if msg.caption else None)
-                                else:
-                                    failed += 1
-                                    continue
-                            
-                            # Add file details to status
-                            details.append(f"📎 Type: {msg.media.value if hasattr(msg.media, 'value') else str(msg.media)}")
-                            if hasattr(msg, 'video') and msg.video:
-                                details.append(f"🎥 Video: {msg.video.file_size / (1024*1024):.1f}MB")
-                                details.append(f"⏱️ Duration: {msg.video.duration}s")
-                                details.append(f"📐 Resolution: {msg.video.width}x{msg.video.height}")
-                            elif hasattr(msg, 'document') and msg.document:
-                                details.append(f"📄 Document: {msg.document.file_name}")
-                                details.append(f"📦 Size: {msg.document.file_size / (1024*1024):.1f}MB")
-                            elif hasattr(msg, 'photo') and msg.photo:
-                                details.append(f"🖼️ Photo: {msg.photo.file_size / (1024*1024):.1f}MB")
-                            elif hasattr(msg, 'audio') and msg.audio:
-                                details.append(f"🎵 Audio: {msg.audio.file_size / (1024*1024):.1f}MB")
-                                details.append(f"⏱️ Duration: {msg.audio.duration}s")
-                            if msg.caption:
-                                caption_preview = msg.caption[:50] + "..." if len(msg.caption) > 50 else msg.caption
-                                details.append(f"📝 Caption: {caption_preview}")
-                            copied += 1
+                            # Pyrogram uploads only io.IOBase objects, which SpooledTemporaryFile is
+                            # just from Python 3.11; its backing BytesIO or temp file always is
+                            await retry_flood_wait(
+                                client.send_document, user_id, file._file,
+                                caption=msg.caption if msg.caption else None,
+                                file_name=media_file_name(msg)
+                            )
                         except Exception as e:
-                            logger.error(f"Error processing media message {msg_id}: {e}")
+                            logger.error(f"Error sending file: {e}")
                             failed += 1
+                            return
+                        finally:
+                            file.close()
+                        
+                        # Add file details to status
+                        details.append(f"📎 Type: {msg.media.value if hasattr(msg.media, 'value') else str(msg.media)}")
+                        if hasattr(msg, 'video') and msg.video:
+                            details.append(f"🎥 Video: {msg.video.file_size / (1024*1024):.1f}MB")
+                            details.append(f"⏱️ Duration: {msg.video.duration}s")
+                            details.append(f"📐 Resolution: {msg.video.width}x{msg.video.height}")
+                        elif hasattr(msg, 'document') and msg.document:
+                            details.append(f"📄 Document: {msg.document.file_name}")
+                            details.append(f"📦 Size: {msg.document.file_size / (1024*1024):.1f}MB")
+                        elif hasattr(msg, 'photo') and msg.photo:
+                            details.append(f"🖼️ Photo: {msg.photo.file_size / (1024*1024):.1f}MB")
+                        elif hasattr(msg, 'audio') and msg.audio:
+                            details.append(f"🎵 Audio: {msg.audio.file_size / (1024*1024):.1f}MB")
+                            details.append(f"⏱️ Duration: {msg.audio.duration}s")
+                        if msg.caption:
+                            caption_preview = msg.caption[:50] + "..." if len(msg.caption) > 50 else msg.caption
+                            details.append(f"📝 Caption: {caption_preview}")
+                        copied += 1
                     elif msg.text or msg.caption:
-                        await client.send_message(user_id, msg.text or msg.caption)
+                        await retry_flood_wait(client.send_message, user_id, msg.text or msg.caption)
                         details.append("📝 Text message")
                         copied += 1
                     else:
-                        await status_msg.edit_text(f"Message {msg_id} is of an unsupported type and was skipped.\nProgress: {idx}/{total}")
+                        await edit_status(f"Message {msg_id} is of an unsupported type and was skipped.\nProgress: {idx}/{total}")
                         failed += 1
-                        continue
-                    await status_msg.edit_text("\n".join(details) + f"\n✓ Success: {copied}\n❌ Failed: {failed}")
+                        return
+                    await edit_status("\n".join(details) + f"\n✓ Success: {copied}\n❌ Failed: {failed}")
                 
-                # Final cleanup of any remaining files
-                try:
-                    for file in os.listdir(temp_dir):
-                        file_path = os.path.join(temp_dir, file)
+                # PERSONAL_COPY_WORKERS messages are fetched and downloaded at once, but they are
+                # sent strictly in message order: each worker waits for its turn before sending
+                pending_ids = iter(enumerate(range(start_id, end_id + 1), 1))
+                send_turn = asyncio.Condition()
+                next_to_send = 1
+                cancelled = False
+                unauthorized = False
+                
+                async def copy_worker():
+                    nonlocal next_to_send, cancelled, failed
+                    for idx, msg_id in pending_ids:
+                        fetched = None
                         try:
-                            if os.path.isfile(file_path):
-                                os.remove(file_path)
-                                logger.info(f"Successfully deleted remaining file: {file_path}")
+                            # Check if operation was cancelled
+                            if not cancelled and session_handler.get_user_session(user_id).get('is_cancelled'):
+                                cancelled = True
+                            if cancelled:
+                                return
+                            fetched = await fetch_one(idx, msg_id)
+                            async with send_turn:
+                                await send_turn.wait_for(lambda: cancelled or next_to_send == idx)
+                                if fetched and not cancelled:
+                                    # send_one closes the file itself
+                                    sending, fetched = fetched, None
+                                    await send_one(idx, msg_id, *sending)
                         except Exception as e:
-                            logger.warning(f"Error removing file {file_path}: {e}")
-                    
-                    # Try to remove the temp directory if it's empty
-                    try:
-                        os.rmdir(temp_dir)
-                        logger.info(f"Successfully removed temporary directory: {temp_dir}")
-                    except Exception as e:
-                        logger.warning(f"Error removing temporary directory {temp_dir}: {e}")
-                except Exception as e:
-                    logger.error(f"Error during final cleanup: {e}")
+                            logger.error(f"Error copying message {msg_id}: {e}")
+                            failed += 1
+                        finally:
+                            if fetched and fetched[1]:
+                                fetched[1].close()
+                            # Always pass the turn on, or the workers holding later IDs would wait forever
+                            async with send_turn:
+                                await send_turn.wait_for(lambda: cancelled or next_to_send == idx)
+                                next_to_send += 1
+                                send_turn.notify_all()
                 
-                await status_msg.edit_text(f"✅ Done! {copied} messages copied, {failed} failed.")
-                stats = user_manager.get_user_stats(user_id)
-                if not (stats['is_owner'] or stats['is_vip']):
+                await asyncio.gather(*(copy_worker() for _ in range(PERSONAL_COPY_WORKERS)))
+                if unauthorized:
+                    # Drop the dead client so the next use reconnects
+                    await session_handler.invalidate_client(user_id)
+                    await retry_flood_wait(
+                        status_msg.edit_text,
+                        f"❌ Your session is no longer valid. Please create a new session.\nCopied {copied} messages before it stopped.")
+                else:
+                    if cancelled:
+                        await retry_flood_wait(status_msg.edit_text, "🛑 Copy operation cancelled by user.")
+                    
+                    await retry_flood_wait(status_msg.edit_text, f"✅ Done! {copied} messages copied, {failed} failed.")
+                if not is_privileged:
                     user_manager.increment_message_count(user_id, copied)
+                    user_manager.flush_message_counts()
                 session_handler.update_user_session(user_id, {'state': 'main_menu'})
             except Exception as e:
                 logger.error(f"Error in personal copy handler: {e}")
                 await message.reply("Something went wrong. Please try again or check your link.")
+            finally:
+                if user_client:
+                    session_handler.unpin_client(user_id)
             return
         else:
             await message.reply("Please use the menu buttons to navigate.", 
@@ -584,12 +703,9 @@ async def handle_source_channel_input(message: Message, text: str):
         if not client:
             await message.reply("❌ No active session. Please create a session first.")
             return
-        import re
         text = text.strip()
-        link_pattern_private = r"https?://t\.me/c/(\d+)/(\d+)"
-        link_pattern_public = r"https?://t\.me/([\w_]+)/([0-9]+)"
-        match_private = re.match(link_pattern_private, text)
-        match_public = re.match(link_pattern_public, text)
+        match_private = LINK_PRIVATE_RE.match(text)
+        match_public = LINK_PUBLIC_RE.match(text)
         channel_id = None
         channel_username = None
         msg_id = None
@@ -688,14 +804,6 @@ async def handle_source_channel_input(message: Message, text: str):
 
         # fallback to old logic for username, invite, or ID
         cleaned, input_type = message_handler.clean_channel_input(text)
-        result_msg = (
-            "Accepted formats:\n"
-            "• Channel username: @channelname\n"
-            "• Channel link: https://t.me/channelname\n"
-            "• Channel ID: -1001234567890\n"
-            "• Invitation link: https://t.me/+AbCdEfGhIj\n"
-            "• Message link: https://t.me/c/123456789/1 or https://t.me/channelname/1\n"
-        )
         chat = None
         error = None
         # Try invite link
@@ -734,10 +842,10 @@ async def handle_source_channel_input(message: Message, text: str):
                 reply_markup=await get_main_menu_keyboard(user_id)
             )
         else:
-            msg = f"❌ Failed to set source channel.\nReason: {error or 'Unknown error.'}\n" + result_msg
-            if input_type != 'invite':
-                msg += "\nIf this is a private channel, please use an invitation link or a message link from the channel."
-            await message.reply(msg)
+            hint = "" if input_type == 'invite' else "\nIf this is a private channel, please use an invitation link or a message link from the channel."
+            await message.reply(
+                f"❌ Failed to set source channel.\nReason: {error or 'Unknown error.'}\n{SOURCE_CHANNEL_FORMATS}{hint}"
+            )
     except Exception as e:
         logger.error(f"Error handling source channel input: {e}")
         await message.reply("❌ An error occurred while setting the source channel.")
@@ -751,13 +859,6 @@ async def handle_target_channel_input(message: Message, text: str):
             await message.reply("❌ No active session. Please create a session first.")
             return
         cleaned, input_type = message_handler.clean_channel_input(text)
-        result_msg = (
-            "Accepted formats:\n"
-            "• Channel username: @channelname\n"
-            "• Channel link: https://t.me/channelname\n"
-            "• Channel ID: -1001234567890\n"
-            "• Invitation link: https://t.me/+AbCdEfGhIj\n"
-        )
         chat = None
         error = None
         # Try invite link first
@@ -801,10 +902,10 @@ async def handle_target_channel_input(message: Message, text: str):
                 reply_markup=await get_main_menu_keyboard(user_id)
             )
         else:
-            msg = f"❌ Failed to set target channel.\nReason: {error or 'Unknown error.'}\n" + result_msg
-            if input_type != 'invite':
-                msg += "\nIf this is a private channel, please use an invitation link."
-            await message.reply(msg)
+            hint = "" if input_type == 'invite' else "\nIf this is a private channel, please use an invitation link."
+            await message.reply(
+                f"❌ Failed to set target channel.\nReason: {error or 'Unknown error.'}\n{TARGET_CHANNEL_FORMATS}{hint}"
+            )
     except Exception as e:
         logger.error(f"Error handling target channel input: {e}")
         await message.reply("❌ An error occurred while setting the target channel.")
@@ -925,11 +1026,7 @@ async def handle_message_range_input(message: Message, range_text: str):
             'state': 'main_menu'
         })
         # Add buttons for copying and resetting
-        keyboard = InlineKeyboardMarkup([
-            [InlineKeyboardButton("🚀 Start Copying", callback_data="start_copy")],
-            [InlineKeyboardButton("🔄 Reset Copy Parameters", callback_data="reset_copy")],
-            [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-        ])
+        keyboard = RANGE_SET_KEYBOARD
         await message.reply(
             f"✅ <b>Message range set successfully!</b>\n\n"
             f"<b>Range:</b> {start_id} - {end_id}",
@@ -959,8 +1056,8 @@ async def handle_vip_promotion_input(message: Message, user_id_text: str):
             await message.reply(f"✅ User {user_id} promoted to VIP successfully!", reply_markup=await get_main_menu_keyboard(owner_id))
             # Notify the user
             try:
-                await app.send_message(
-                    user_id,
+                await retry_flood_wait(
+                    app.send_message, user_id,
                     "🎉 <b>Congratulations!</b> You are now a <b>VIP</b> user!\n\n"
                     "As a VIP, you enjoy:\n"
                     "• <b>Unlimited message copying</b>\n"
@@ -996,8 +1093,8 @@ async def handle_vip_demotion_input(message: Message, user_id_text: str):
             await message.reply(f"✅ User {user_id} demoted from VIP successfully!", reply_markup=await get_main_menu_keyboard(owner_id))
             # Notify the user
             try:
-                await app.send_message(
-                    user_id,
+                await retry_flood_wait(
+                    app.send_message, user_id,
                     "⚠️ <b>Your VIP status has been removed.</b> You are now a <b>Free User</b>.\n\n"
                     "As a free user, you can:\n"
                     "• Copy up to your daily message limit\n"
@@ -1030,15 +1127,8 @@ async def handle_free_limit_input(message: Message, limit_text: str):
             return
         user_manager.save_free_limit(new_limit)
         # Reset message count for all free users
-        from database import DatabaseManager
-        db = DatabaseManager()
-        users = db.cursor.execute('SELECT user_id, is_vip, is_owner FROM users').fetchall()
-        reset_count = 0
-        for row in users:
-            user_id, is_vip, is_owner = row
-            if not is_vip and not is_owner:
-                db.reset_message_count(user_id)
-                reset_count += 1
+        reset_count = user_manager.db.reset_free_message_counts()
+        user_manager.invalidate_user_cache()
         await message.reply(f"✅ Free user daily message limit set to {new_limit}.\nAll free users' daily usage has been reset ({reset_count} users).")
     except Exception as e:
         logger.error(f"Error setting free user limit: {e}")
@@ -1050,21 +1140,27 @@ async def handle_broadcast_input(message: Message, text: str):
         if not user_manager.is_owner(owner_id):
             await message.reply("❌ You are not authorized to perform this action.")
             return
-        from database import DatabaseManager
-        db = DatabaseManager()
-        users = db.cursor.execute('SELECT user_id FROM users').fetchall()
-        count = 0
-        for row in users:
-            try:
-                await app.send_message(row[0], text)
-                count += 1
-            except Exception:
-                continue
+        db = user_manager.db
+        user_ids = itertools.chain.from_iterable(db.iter_user_id_batches(BROADCAST_BATCH_SIZE))
+        count = await broadcast_text(user_ids, text)
         await message.reply(f"✅ Broadcast sent to {count} users.")
     except Exception as e:
         logger.error(f"Error broadcasting: {e}")
         await message.reply("❌ An error occurred. Please try again.")
 
+# Text input states handled by their own function; text_handler handles the rest inline
+STATE_HANDLERS = {
+    'awaiting_phone': handle_phone_input,
+    'awaiting_code': handle_code_input,
+    'awaiting_password': handle_password_input,
+    'awaiting_session_string': handle_session_string_input,
+    'awaiting_source_channel': handle_source_channel_input,
+    'awaiting_target_channel': handle_target_channel_input,
+    'awaiting_message_range': handle_message_range_input,
+    'awaiting_vip_promotion': handle_vip_promotion_input,
+    'awaiting_vip_demotion': handle_vip_demotion_input,
+}
+
 def reset_copy_parameters(user_id):
     session_handler.update_user_session(user_id, {
         'source_channel': None,
@@ -1077,8 +1173,7 @@ def reset_copy_parameters(user_id):
     })
 
 async def get_main_menu_keyboard(user_id: int):
-    from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-    return InlineKeyboardMarkup([[InlineKeyboardButton("🏠 Main Menu", callback_data="main_menu")]])
+    return MAIN_MENU_KEYBOARD
 
 @app.on_message(filters.command("reset") & filters.private)
 async def reset_user_limit(client: Client, message: Message):
@@ -1106,12 +1201,17 @@ async def reset_user_limit(client: Client, message: Message):
     try:
         logger.info(f"Resetting message count for user {target_user_id}")
         user_manager.db.reset_message_count(target_user_id)
+        user_manager.invalidate_user_cache(target_user_id)
         await message.reply(f"✅ Message count reset for user {target_user_id}.")
     except Exception as e:
         logger.error(f"Error resetting message count for {target_user_id}: {e}")
         await message.reply("❌ Failed to reset message count.")
 
 if __name__ == "__main__":
+    # Pyrogram's own errors for an empty token or API ID don't say which setting is missing
+    missing = [name for name, value in (("API_ID", API_ID), ("API_HASH", API_HASH), ("BOT_TOKEN", BOT_TOKEN)) if not value]
+    if missing:
+        raise SystemExit(f"Missing required environment variable(s): {', '.join(missing)}")
     logger.info("Starting Telegram Copier Bot...")
     try:
         app.run()
@@ -1121,4 +1221,5 @@ if __name__ == "__main__":
         logger.error(f"Bot error: {e}")
     finally:
         logger.info("Cleaning up...")
+        user_manager.flush_message_counts()
         asyncio.run(session_handler.disconnect_all())
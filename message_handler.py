@@ -3,25 +3,37 @@ import logging
 import time
 import re
 import os
+import tempfile
 from typing import Optional, Callable, Tuple
 from pyrogram import Client
-from pyrogram.types import Message
-from pyrogram.errors import FloodWait, UserAlreadyParticipant, InviteHashExpired, InviteHashInvalid
-from config import PROGRESS_UPDATE_INTERVAL, MAX_RETRIES, RETRY_DELAY
+from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
+from pyrogram.errors import FloodWait, UserAlreadyParticipant, InviteHashExpired, InviteHashInvalid, Unauthorized
+from utils import ThrottledEditor, retry_flood_wait
+from config import PROGRESS_UPDATE_INTERVAL, PROGRESS_EDIT_INTERVAL, MAX_RETRIES, RETRY_DELAY, TEMP_DOWNLOAD_DIR
 
 logger = logging.getLogger(__name__)
 
+# Invitation links: t.me/+<hash> or t.me/joinchat/<hash>
+_INVITE_LINK_RE = re.compile(r't\.me/(?:\+|joinchat/)([A-Za-z0-9_-]+)')
+
+# Shown when a free user runs out of messages mid-copy
+_UPGRADE_VIP_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("⭐ Upgrade to VIP", callback_data="show_vip_upgrade")],
+    [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
+])
+
 class MessageHandler:
     def __init__(self, session_handler, user_manager):
         self.session_handler = session_handler
         self.user_manager = user_manager
+        os.makedirs(TEMP_DOWNLOAD_DIR, exist_ok=True)
 
     def clean_channel_input(self, channel: str) -> tuple[str, str]:
         """Clean and normalize channel input, return (cleaned_input, input_type)"""
         channel = channel.strip()
         
         # Check for invitation link
-        invite_match = re.search(r't\.me/(?:\+|joinchat/)([A-Za-z0-9_-]+)', channel)
+        invite_match = _INVITE_LINK_RE.search(channel)
         if invite_match:
             return invite_match.group(1), 'invite'
         
@@ -156,45 +168,37 @@ class MessageHandler:
 
     async def copy_messages(self, user_id: int, source_id: str, target_id: str, start_msg_id: int, end_msg_id: int, progress_callback: Optional[Callable] = None, status_message=None) -> tuple[bool, str]:
         """Copy messages from source to target channel by downloading and re-uploading, with detailed monitoring and temp cleanup."""
+        client = None
         try:
-            client = await self.session_handler.get_user_client(user_id)
+            client = await self.session_handler.get_user_client(user_id, refresh=True)
             if not client:
                 return False, "❌ No active session found. Please create a session first."
+            self.session_handler.pin_client(user_id)
 
             copied = 0
             failed = 0
             total = end_msg_id - start_msg_id + 1
-            temp_dir = "temp_downloads"
-            if not os.path.exists(temp_dir):
-                os.makedirs(temp_dir)
 
             logger.info(f"Starting copy operation: {total} messages from {source_id} to {target_id}")
             status_msg = status_message
             avg_upload_speeds = []
+            # Read once; the quota check below counts this run's copies locally
             stats = self.user_manager.get_user_stats(user_id)
             is_free_user = not (stats['is_owner'] or stats['is_vip'])
+            message_count = stats['message_count']
+            
+            # Progress edits are best effort
+            edit_status = ThrottledEditor(status_msg, PROGRESS_EDIT_INTERVAL)
             
             for idx, msg_id in enumerate(range(start_msg_id, end_msg_id + 1), 1):
                 # Check if operation was cancelled
                 session = self.session_handler.get_user_session(user_id)
                 if session.get('is_cancelled'):
-                    # Cleanup temp files before returning
-                    for file in os.listdir(temp_dir):
-                        file_path = os.path.join(temp_dir, file)
-                        try:
-                            if os.path.isfile(file_path):
-                                os.remove(file_path)
-                        except Exception as e:
-                            logger.warning(f"Error removing file {file_path}: {e}")
                     return True, f"🛑 Copy operation cancelled by user. Copied {copied} messages before cancellation."
                 
                 # Check message limit for free users
-                if is_free_user and stats['message_count'] >= stats['message_limit']:
-                    from pyrogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                    keyboard = InlineKeyboardMarkup([
-                        [InlineKeyboardButton("⭐ Upgrade to VIP", callback_data="show_vip_upgrade")],
-                        [InlineKeyboardButton("🔙 Main Menu", callback_data="main_menu")]
-                    ])
+                if is_free_user and message_count >= stats['message_limit']:
+                    keyboard = _UPGRADE_VIP_KEYBOARD
                     if status_msg:
                         await status_msg.edit_text(
                             f"❌ You have reached your daily free message limit.\n\nUpgrade to VIP for unlimited copying!",
@@ -207,9 +211,11 @@ class MessageHandler:
                         failed += 1
                         continue
 
+                    # Formatted once per message; the progress callbacks below reuse it
+                    date_text = message.date.strftime('%Y-%m-%d %H:%M:%S') if hasattr(message, 'date') else ''
                     details = [
                         f"📝 Processing message {msg_id} ({idx}/{total})...",
-                        f"📅 Date: {message.date.strftime('%Y-%m-%d %H:%M:%S') if hasattr(message, 'date') else ''}"
+                        f"📅 Date: {date_text}"
                     ]
                     file = None
                     media_type = None
@@ -236,127 +242,148 @@ class MessageHandler:
                         if message.caption:
                             caption_preview = message.caption[:50] + "..." if len(message.caption) > 50 else message.caption
                             details.append(f"📝 Caption: {caption_preview}")
+                        # Server-side copy first: no download or re-upload. Protected sources refuse it,
+                        # and a failed copy falls back to downloading and re-sending the file below.
+                        if not message.has_protected_content:
+                            try:
+                                sent_message = await client.copy_message(target_id, source_id, msg_id)
+                            except Exception as e:
+                                logger.info(f"copy_message failed for {msg_id}, re-uploading instead: {e}")
+                                sent_message = None
+                            if sent_message:
+                                copied += 1
+                                if is_free_user:
+                                    self.user_manager.increment_message_count(user_id)
+                                    message_count += 1
+                                await edit_status("\n".join(details) + f"\n✓ Success: {copied}\n❌ Failed: {failed}")
+                                continue
                         # --- Fix photo extension ---
                         ext = ".jpg" if media_type == "photo" else f".tmp"
-                        temp_file = os.path.join(temp_dir, f"temp_{msg_id}_{media_type}{ext}")
-                        # Download with progress
-                        last_edit_time = time.time()
-                        min_edit_interval = 1
-                        download_size = file_size or 0
-                        download_speed_samples = []
-                        max_samples = 10
-                        last_download_bytes = 0
-                        download_start_time = time.time()
-                        async def progress_callback_dl(current, total_size):
-                            nonlocal last_edit_time, download_size, download_speed_samples, last_download_bytes
-                            now = time.time()
-                            download_size = total_size
-                            time_diff = now - download_start_time
-                            bytes_diff = current - last_download_bytes
-                            download_speed = bytes_diff / (now - last_edit_time) if now - last_edit_time > 0 else 0
-                            download_speed_mb = download_speed / (1024 * 1024)
-                            download_speed_samples.append(download_speed_mb)
-                            if len(download_speed_samples) > max_samples:
-                                download_speed_samples.pop(0)
-                            avg_download_speed = sum(download_speed_samples) / len(download_speed_samples) if download_speed_samples else 0
-                            if now - last_edit_time >= min_edit_interval:
-                                percentage = current * 100 / total_size if total_size else 0
-                                bar_length = 30
-                                filled_length = int(bar_length * current // total_size) if total_size else 0
-                                bar = '█' * filled_length + '░' * (bar_length - filled_length)
-                                status_text = (
-                                    f"📝 Processing message {msg_id} ({idx}/{total})...\n"
-                                    f"📅 Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                    + "\n".join(details) + "\n"
-                                    f"📥 Download Progress:\n[{bar}] {percentage:.1f}%\nSize: {current/(1024*1024):.1f}MB / {total_size/(1024*1024):.1f}MB\n"
-                                    f"⬇️ Current Speed: {download_speed_mb:.1f} MB/s\n"
-                                    f"⬇️ Average Speed: {avg_download_speed:.1f} MB/s\n"
-                                    f"✓ Success: {copied}\n❌ Failed: {failed}"
-                                )
-                                if status_msg:
-                                    try:
-                                        await status_msg.edit_text(status_text)
-                                    except Exception:
-                                        pass
-                                last_edit_time = now
-                                last_download_bytes = current
-                        file = await client.download_media(message, file_name=temp_file, progress=progress_callback_dl)
-                        if not file:
-                            failed += 1
-                            continue
-                        # Upload with progress
-                        media_handlers = {
-                            "photo": client.send_photo,
-                            "video": client.send_video,
-                            "document": client.send_document,
-                            "audio": client.send_audio,
-                            "voice": client.send_voice,
-                            "animation": client.send_animation,
-                            "sticker": client.send_sticker,
-                            "video_note": client.send_video_note
-                        }
-                        handler = media_handlers.get(media_type)
-                        send_kwargs = {"caption": message.caption if hasattr(message, 'caption') else ''}
-                        if media_type == "video" and hasattr(message, 'video'):
-                            send_kwargs["duration"] = getattr(message.video, "duration", None)
-                            send_kwargs["width"] = getattr(message.video, "width", None)
-                            send_kwargs["height"] = getattr(message.video, "height", None)
-                        if media_type == "document" and hasattr(message, 'document'):
-                            send_kwargs["file_name"] = getattr(message.document, "file_name", None)
-                        # Upload progress
-                        upload_start = time.time()
-                        upload_last = upload_start
-                        upload_bytes = 0
-                        upload_speed_samples = []
-                        async def progress_callback_ul(current, total_size):
-                            nonlocal upload_last, upload_bytes, upload_speed_samples, last_edit_time
-                            now = time.time()
-                            if now - upload_last >= min_edit_interval:
-                                percentage = current * 100 / download_size if download_size else 0
-                                bar_length = 30
-                                filled_length = int(bar_length * current // download_size) if download_size else 0
-                                bar = '█' * filled_length + '░' * (bar_length - filled_length)
-                                speed = (current - upload_bytes) / (now - upload_last) / (1024*1024) if now - upload_last > 0 else 0
-                                upload_speed_samples.append(speed)
-                                if len(upload_speed_samples) > 10:
-                                    upload_speed_samples.pop(0)
-                                avg_speed = sum(upload_speed_samples) / len(upload_speed_samples) if upload_speed_samples else 0
-                                upload_status = (
-                                    f"📝 Processing message {msg_id} ({idx}/{total})...\n"
-                                    f"📅 Date: {message.date.strftime('%Y-%m-%d %H:%M:%S')}\n"
-                                    + "\n".join(details) + "\n"
-                                    f"📤 Upload Progress:\n[{bar}] {percentage:.1f}%\nSize: {current/(1024*1024):.1f}MB / {download_size/(1024*1024):.1f}MB\n"
-                                    f"⬆️ Current Speed: {speed:.1f} MB/s\n"
-                                    f"⬆️ Average Speed: {avg_speed:.1f} MB/s\n"
-                                    f"✓ Success: {copied}\n❌ Failed: {failed}"
-                                )
-                                if status_msg:
-                                    try:
-                                        await status_msg.edit_text(upload_status)
-                                    except Exception:
-                                        pass
-                                upload_last = now
-                                upload_bytes = current
-                        # Send the media
-                        sent_message = await handler(target_id, file, **send_kwargs, progress=progress_callback_ul)
-                        if sent_message:
-                            copied += 1
-                            # Increment message count for free users
-                            stats = self.user_manager.get_user_stats(user_id)
-                            if not (stats['is_owner'] or stats['is_vip']):
-                                self.user_manager.increment_message_count(user_id)
-                        else:
-                            failed += 1
+                        # A unique name per download, so concurrent copies of the same message don't collide
+                        fd, temp_file = tempfile.mkstemp(suffix=ext, prefix=f"temp_{msg_id}_{media_type}_", dir=TEMP_DOWNLOAD_DIR)
+                        os.close(fd)
+                        try:
+                            # Download with progress
+                            last_edit_time = time.time()
+                            min_edit_interval = PROGRESS_EDIT_INTERVAL
+                            download_size = file_size or 0
+                            download_speed_samples = []
+                            max_samples = 10
+                            last_download_bytes = 0
+                            download_start_time = time.time()
+                            async def progress_callback_dl(current, total_size):
+                                nonlocal last_edit_time, download_size, download_speed_samples, last_download_bytes
+                                now = time.time()
+                                download_size = total_size
+                                time_diff = now - download_start_time
+                                bytes_diff = current - last_download_bytes
+                                download_speed = bytes_diff / (now - last_edit_time) if now - last_edit_time > 0 else 0
+                                download_speed_mb = download_speed / (1024 * 1024)
+                                download_speed_samples.append(download_speed_mb)
+                                if len(download_speed_samples) > max_samples:
+                                    download_speed_samples.pop(0)
+                                avg_download_speed = sum(download_speed_samples) / len(download_speed_samples) if download_speed_samples else 0
+                                if now - last_edit_time >= min_edit_interval:
+                                    percentage = current * 100 / total_size if total_size else 0
+                                    bar_length = 30
+                                    filled_length = int(bar_length * current // total_size) if total_size else 0
+                                    bar = '█' * filled_length + '░' * (bar_length - filled_length)
+                                    status_text = (
+                                        f"📝 Processing message {msg_id} ({idx}/{total})...\n"
+                                        f"📅 Date: {date_text}\n"
+                                        + "\n".join(details) + "\n"
+                                        f"📥 Download Progress:\n[{bar}] {percentage:.1f}%\nSize: {current/(1024*1024):.1f}MB / {total_size/(1024*1024):.1f}MB\n"
+                                        f"⬇️ Current Speed: {download_speed_mb:.1f} MB/s\n"
+                                        f"⬇️ Average Speed: {avg_download_speed:.1f} MB/s\n"
+                                        f"✓ Success: {copied}\n❌ Failed: {failed}"
+                                    )
+                                    await edit_status(status_text)
+                                    last_edit_time = now
+                                    last_download_bytes = current
+                            file = await client.download_media(message, file_name=temp_file, progress=progress_callback_dl)
+                            if not file:
+                                failed += 1
+                                continue
+                            # Upload with progress
+                            media_handlers = {
+                                "photo": client.send_photo,
+                                "video": client.send_video,
+                                "document": client.send_document,
+                                "audio": client.send_audio,
+                                "voice": client.send_voice,
+                                "animation": client.send_animation,
+                                "sticker": client.send_sticker,
+                                "video_note": client.send_video_note
+                            }
+                            handler = media_handlers.get(media_type)
+                            send_kwargs = {"caption": message.caption if hasattr(message, 'caption') else ''}
+                            if media_type == "video" and hasattr(message, 'video'):
+                                send_kwargs["duration"] = getattr(message.video, "duration", None)
+                                send_kwargs["width"] = getattr(message.video, "width", None)
+                                send_kwargs["height"] = getattr(message.video, "height", None)
+                            if media_type == "document" and hasattr(message, 'document'):
+                                send_kwargs["file_name"] = getattr(message.document, "file_name", None)
+                            # Upload progress
+                            upload_start = time.time()
+                            upload_last = upload_start
+                            upload_bytes = 0
+                            upload_speed_samples = []
+                            async def progress_callback_ul(current, total_size):
+                                nonlocal upload_last, upload_bytes, upload_speed_samples, last_edit_time
+                                now = time.time()
+                                if now - upload_last >= min_edit_interval:
+                                    percentage = current * 100 / download_size if download_size else 0
+                                    bar_length = 30
+                                    filled_length = int(bar_length * current // download_size) if download_size else 0
+                                    bar = '█' * filled_length + '░' * (bar_length - filled_length)
+                                    speed = (current - upload_bytes) / (now - upload_last) / (1024*1024) if now - upload_last > 0 else 0
+                                    upload_speed_samples.append(speed)
+                                    if len(upload_speed_samples) > 10:
+                                        upload_speed_samples.pop(0)
+                                    avg_speed = sum(upload_speed_samples) / len(upload_speed_samples) if upload_speed_samples else 0
+                                    upload_status = (
+                                        f"📝 Processing message {msg_id} ({idx}/{total})...\n"
+                                        f"📅 Date: {date_text}\n"
+                                        + "\n".join(details) + "\n"
+                                        f"📤 Upload Progress:\n[{bar}] {percentage:.1f}%\nSize: {current/(1024*1024):.1f}MB / {download_size/(1024*1024):.1f}MB\n"
+                                        f"⬆️ Current Speed: {speed:.1f} MB/s\n"
+                                        f"⬆️ Average Speed: {avg_speed:.1f} MB/s\n"
+                                        f"✓ Success: {copied}\n❌ Failed: {failed}"
+                                    )
+                                    await edit_status(upload_status)
+                                    upload_last = now
+                                    upload_bytes = current
+                            # Send the media
+                            sent_message = await retry_flood_wait(handler, target_id, file, **send_kwargs, progress=progress_callback_ul)
+                            if sent_message:
+                                copied += 1
+                                # Increment message count for free users
+                                if is_free_user:
+                                    self.user_manager.increment_message_count(user_id)
+                                    message_count += 1
+                            else:
+                                failed += 1
+                        finally:
+                            # Unlinking a multi-GB file can take a while on some filesystems
+                            try:
+                                await asyncio.to_thread(os.remove, temp_file)
+                            except OSError as e:
+                                logger.warning(f"Error removing file {temp_file}: {e}")
                     # If the message has no media, but has text, copy the text message
                     if not message.media and (message.text or message.caption):
                         text_content = message.text or message.caption
-                        await client.send_message(target_id, text_content)
+                        await retry_flood_wait(client.send_message, target_id, text_content)
                         copied += 1
                         # Increment message count for free users
-                        stats = self.user_manager.get_user_stats(user_id)
-                        if not (stats['is_owner'] or stats['is_vip']):
+                        if is_free_user:
                             self.user_manager.increment_message_count(user_id)
+                            message_count += 1
                         continue
+                except Unauthorized as e:
+                    # The session was revoked or expired: drop the client so the next use reconnects
+                    logger.warning(f"Session for user {user_id} is no longer authorized: {e}")
+                    await self.session_handler.invalidate_client(user_id)
+                    return False, f"❌ Your session is no longer valid. Please create a new session.\nCopied {copied} messages before it stopped."
                 except Exception as e:
                     logger.error(f"Error processing message {msg_id}: {e}")
                     failed += 1
@@ -366,17 +393,16 @@ class MessageHandler:
                 final_status = f"✅ Copy complete: {copied} messages copied, {failed} failed."
                 await status_msg.edit_text(final_status)
 
-            # Cleanup: Remove temp files
-            for file in os.listdir(temp_dir):
-                file_path = os.path.join(temp_dir, file)
-                try:
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-                except Exception as e:
-                    logger.warning(f"Error removing file {file_path}: {e}")
-            
             return True, f"✅ Successfully copied {copied} messages."
         
         except Exception as e:
             logger.error(f"Error in copy_messages: {e}")
             return False, f"❌ Error during message copy: {str(e)}"
+        finally:
+            # Also on early returns (limit reached, cancelled, errors), so no counted copy stays buffered
+            try:
+                self.user_manager.flush_message_counts()
+            except Exception as e:
+                logger.error(f"Error saving message counts for user {user_id}: {e}")
+            if client:
+                self.session_handler.unpin_client(user_id)
@@ -3,10 +3,12 @@ import json
 import time
 import asyncio
 import logging
+import threading
 from typing import Dict, Optional
 from pyrogram import Client
-from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PhoneCodeExpired
-from config import API_ID, API_HASH
+from pyrogram.errors import SessionPasswordNeeded, PhoneCodeInvalid, PhoneCodeExpired, Unauthorized
+from pyrogram.raw.functions.updates import GetState
+from config import API_ID, API_HASH, CLIENT_PING_TIMEOUT, CLIENT_IDLE_TIMEOUT, CLIENT_REAPER_INTERVAL, CLIENT_REVALIDATE_INTERVAL
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,11 @@ class SessionHandler:
         self.sessions_file = "user_sessions.json"
         self.user_sessions = {}
         self.active_clients = {}
+        self._client_locks = {}
+        self._client_last_used = {}
+        self._clients_in_use = {}
+        self._reaper_task = None
+        self._save_lock = threading.Lock()
         self.load_sessions()
         self._cleanup_old_sessions()
 
@@ -57,50 +64,58 @@ class SessionHandler:
 
     def save_sessions(self):
         """Save user sessions to JSON file"""
-        try:
-            # Create backup
-            if os.path.exists(self.sessions_file):
-                backup_file = f"{self.sessions_file}.backup"
-                try:
-                    os.rename(self.sessions_file, backup_file)
-                except:
-                    pass
+        self._write_sessions(self._snapshot_sessions())
+
+    def _snapshot_sessions(self) -> Dict:
+        """Copy session data so it can be serialized while the originals keep changing"""
+        return {str(k): dict(v) for k, v in self.user_sessions.items()}
+
+    def _write_sessions(self, data: Dict):
+        """Write a sessions snapshot to the JSON file"""
+        with self._save_lock:
+            try:
+                # Create backup
+                if os.path.exists(self.sessions_file):
+                    backup_file = f"{self.sessions_file}.backup"
+                    try:
+                        os.rename(self.sessions_file, backup_file)
+                    except:
+                        pass
             
-            # Write new sessions
-            temp_file = f"{self.sessions_file}.tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                data = {str(k): v for k, v in self.user_sessions.items()}
-                json.dump(data, f, indent=4, ensure_ascii=False)
+                # Write new sessions
+                temp_file = f"{self.sessions_file}.tmp"
+                with open(temp_file, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, indent=4, ensure_ascii=False)
             
-            # Atomic replace
-            os.rename(temp_file, self.sessions_file)
+                # Atomic replace
+                os.rename(temp_file, self.sessions_file)
             
-            # Remove backup if successful
-            backup_file = f"{self.sessions_file}.backup"
-            if os.path.exists(backup_file):
-                try:
-                    os.remove(backup_file)
-                except:
-                    pass
+                # Remove backup if successful
+                backup_file = f"{self.sessions_file}.backup"
+                if os.path.exists(backup_file):
+                    try:
+                        os.remove(backup_file)
+                    except:
+                        pass
                     
-            logger.debug("Sessions saved successfully")
-        except Exception as e:
-            logger.error(f"Error saving sessions: {e}")
-            # Try to restore backup
-            backup_file = f"{self.sessions_file}.backup"
-            if os.path.exists(backup_file):
-                try:
-                    os.rename(backup_file, self.sessions_file)
-                    logger.info("Restored session backup")
-                except:
-                    pass
-            # Clean up temp file
-            temp_file = f"{self.sessions_file}.tmp"
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+                logger.debug("Sessions saved successfully")
+            except Exception as e:
+                logger.error(f"Error saving sessions: {e}")
+                # Try to restore backup
+                backup_file = f"{self.sessions_file}.backup"
+                if os.path.exists(backup_file):
+                    try:
+                        os.rename(backup_file, self.sessions_file)
+                        logger.info("Restored session backup")
+                    except:
+                        pass
+                # Clean up temp file
+                temp_file = f"{self.sessions_file}.tmp"
+                if os.path.exists(temp_file):
+                    try:
+                        os.remove(temp_file)
+                    except:
+                        pass
 
     def get_user_session(self, user_id: int) -> Dict:
         """Get or create user session"""
@@ -116,6 +131,7 @@ class SessionHandler:
                 'session_string': None,
                 'phone': None,
                 'phone_code_hash': None,
+                'has_active_client': False,
                 'last_active': time.time(),
                 'created_at': time.time()
             }
@@ -128,13 +144,23 @@ class SessionHandler:
 
     def update_user_session(self, user_id: int, data: Dict):
         """Update user session data"""
+        self._apply_session_update(user_id, data)
+        self.save_sessions()
+        logger.debug(f"Updated session for user {user_id}: {list(data.keys())}")
+
+    async def update_user_session_async(self, user_id: int, data: Dict):
+        """Update user session data, writing the file from a worker thread"""
+        self._apply_session_update(user_id, data)
+        await asyncio.to_thread(self._write_sessions, self._snapshot_sessions())
+        logger.debug(f"Updated session for user {user_id}: {list(data.keys())}")
+
+    def _apply_session_update(self, user_id: int, data: Dict):
+        """Apply an update to the in-memory session"""
         if user_id not in self.user_sessions:
             self.user_sessions[user_id] = {}
         
         self.user_sessions[user_id].update(data)
         self.user_sessions[user_id]['last_active'] = time.time()
-        self.save_sessions()
-        logger.debug(f"Updated session for user {user_id}: {list(data.keys())}")
 
     async def clear_user_session(self, user_id: int):
         """Clear user session completely"""
@@ -209,40 +235,149 @@ class SessionHandler:
             logger.info(f"Created client for user {user_id} (Telegram: {me.first_name} {me.last_name or ''})")
             
             self.active_clients[user_id] = client
+            self._set_has_active_client(user_id, True)
             return client
             
         except Exception as e:
             logger.error(f"Error creating client for user {user_id}: {e}")
+            self._set_has_active_client(user_id, False)
             return None
 
-    async def get_user_client(self, user_id: int) -> Optional[Client]:
-        """Get existing user client or create new one"""
-        # Check if we have an active client
+    def _set_has_active_client(self, user_id: int, active: bool):
+        """Record whether the user's session currently yields a working client"""
+        session = self.user_sessions.get(user_id)
+        if session is None or session.get('has_active_client') == active:
+            return
+        session['has_active_client'] = active
+        self.save_sessions()
+
+    def _get_client_lock(self, user_id: int) -> asyncio.Lock:
+        """Per-user lock so concurrent callbacks don't build the same client twice"""
+        lock = self._client_locks.get(user_id)
+        if lock is None:
+            lock = self._client_locks[user_id] = asyncio.Lock()
+        return lock
+
+    async def _ping_client(self, user_id: int, client: Client) -> bool:
+        """Check that a client still answers authorized requests.
+
+        updates.GetState is about the cheapest call that needs a valid session; a bare
+        MTProto Ping would also succeed for a revoked one.
+        """
+        try:
+            await asyncio.wait_for(client.invoke(GetState()), timeout=CLIENT_PING_TIMEOUT)
+            return True
+        except Unauthorized as e:
+            logger.warning(f"Session for user {user_id} is no longer authorized: {e}")
+            self._set_has_active_client(user_id, False)
+            return False
+        except Exception as e:
+            logger.warning(f"Ping failed for user {user_id}: {e}")
+            return False
+
+    async def invalidate_client(self, user_id: int, logged_out: bool = True):
+        """Drop a cached client, e.g. after an auth error, so the next call reconnects.
+
+        Pass logged_out=False when the session itself is still good (an idle disconnect).
+        """
+        if logged_out:
+            self._set_has_active_client(user_id, False)
+        async with self._get_client_lock(user_id):
+            client = self.active_clients.pop(user_id, None)
+            self._client_last_used.pop(user_id, None)
+            if client is not None:
+                try:
+                    await client.stop()
+                except Exception:
+                    pass
+
+    async def _reap_idle_clients(self):
+        """Disconnect clients that haven't been used for CLIENT_IDLE_TIMEOUT seconds,
+        and every CLIENT_REVALIDATE_INTERVAL check that the rest are still authorized"""
+        next_revalidate = time.monotonic() + CLIENT_REVALIDATE_INTERVAL
+        while True:
+            await asyncio.sleep(CLIENT_REAPER_INTERVAL)
+            cutoff = time.monotonic() - CLIENT_IDLE_TIMEOUT
+            for user_id, last_used in list(self._client_last_used.items()):
+                if last_used < cutoff and user_id in self.active_clients and user_id not in self._clients_in_use:
+                    logger.info(f"Disconnecting idle client for user {user_id}")
+                    await self.invalidate_client(user_id, logged_out=False)
+            if time.monotonic() >= next_revalidate:
+                next_revalidate = time.monotonic() + CLIENT_REVALIDATE_INTERVAL
+                await self._revalidate_clients()
+
+    async def _revalidate_clients(self):
+        """Ping idle connected clients; a revoked session clears has_active_client"""
+        for user_id, client in list(self.active_clients.items()):
+            # Pinned clients are mid-operation, which handles auth errors itself
+            if user_id in self._clients_in_use or not client.is_connected:
+                continue
+            if not await self._ping_client(user_id, client):
+                await self.invalidate_client(user_id, logged_out=False)
+
+    def pin_client(self, user_id: int):
+        """Keep the idle reaper off a user's client while a long operation uses it"""
+        self._clients_in_use[user_id] = self._clients_in_use.get(user_id, 0) + 1
+
+    def unpin_client(self, user_id: int):
+        """Release a pin_client; the idle timeout restarts from now"""
+        remaining = self._clients_in_use.get(user_id, 0) - 1
+        if remaining > 0:
+            self._clients_in_use[user_id] = remaining
+        else:
+            self._clients_in_use.pop(user_id, None)
         if user_id in self.active_clients:
-            try:
-                client = self.active_clients[user_id]
-                # Test if client is still connected
-                await client.get_me()
-                return client
-            except Exception as e:
-                logger.warning(f"Client for user {user_id} is disconnected: {e}")
+            self._client_last_used[user_id] = time.monotonic()
+
+    def _touch_client(self, user_id: int):
+        self._client_last_used[user_id] = time.monotonic()
+        if self._reaper_task is None or self._reaper_task.done():
+            self._reaper_task = asyncio.create_task(self._reap_idle_clients())
+
+    async def get_user_client(self, user_id: int, refresh: bool = False) -> Optional[Client]:
+        """Get existing user client or create new one.
+
+        A cached client is returned as long as it is connected; pass refresh=True
+        to also ping it before reuse.
+        """
+        async with self._get_client_lock(user_id):
+            # Check if we have an active client
+            client = self.active_clients.get(user_id)
+            if client is not None:
+                if client.is_connected and (not refresh or await self._ping_client(user_id, client)):
+                    self._touch_client(user_id)
+                    return client
+                logger.warning(f"Client for user {user_id} is disconnected")
                 # Remove disconnected client
                 try:
-                    await self.active_clients[user_id].stop()
-                except:
+                    await client.stop()
+                except Exception:
                     pass
-                del self.active_clients[user_id]
-        
-        # Try to create client from saved session string
+                self.active_clients.pop(user_id, None)
+            
+            # Try to create client from saved session string
+            session = self.get_user_session(user_id)
+            session_string = session.get('session_string')
+            
+            if session_string:
+                logger.info(f"Attempting to restore client for user {user_id} from session string")
+                client = await self.create_user_client(user_id, session_string)
+                if client is not None:
+                    self._touch_client(user_id)
+                return client
+            
+            logger.debug(f"No session available for user {user_id}")
+            return None
+
+    def has_session(self, user_id: int) -> bool:
+        """Whether the user is logged in, judged from memory without contacting Telegram.
+
+        Reads the has_active_client flag kept by login, logout, client creation and the
+        periodic revalidation; sessions saved before the flag existed fall back to
+        having a session string.
+        """
         session = self.get_user_session(user_id)
-        session_string = session.get('session_string')
-        
-        if session_string:
-            logger.info(f"Attempting to restore client for user {user_id} from session string")
-            return await self.create_user_client(user_id, session_string)
-        
-        logger.debug(f"No session available for user {user_id}")
-        return None
+        return bool(session.get('has_active_client', session.get('session_string')))
 
     async def start_phone_verification(self, user_id: int, phone: str) -> tuple[bool, str]:
         """Start phone verification process"""
@@ -298,6 +433,7 @@ class SessionHandler:
             # Save session string
             self.update_user_session(user_id, {
                 'session_string': session_string,
+                'has_active_client': True,
                 'state': 'main_menu'
             })
             
@@ -341,6 +477,7 @@ class SessionHandler:
             # Save session string
             self.update_user_session(user_id, {
                 'session_string': session_string,
+                'has_active_client': True,
                 'state': 'main_menu'
             })
             
@@ -361,6 +498,9 @@ class SessionHandler:
 
     async def disconnect_all(self):
         """Disconnect all active clients"""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
         for user_id, client in list(self.active_clients.items()):
             try:
                 await client.stop()
@@ -368,3 +508,4 @@ class SessionHandler:
             except Exception as e:
                 logger.warning(f"Error disconnecting client for user {user_id}: {e}")
         self.active_clients.clear()
+        self._client_last_used.clear()
@@ -1,87 +1,139 @@
-from database import DatabaseManager
-import json
-import os
-
-class UserManager:
-    CONFIG_FILE = "free_user_limit.json"
-
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.default_free_limit = self.load_free_limit()
-
-    def load_free_limit(self):
-        if os.path.exists(self.CONFIG_FILE):
-            try:
-                with open(self.CONFIG_FILE, "r") as f:
-                    data = json.load(f)
-                    return int(data.get("free_limit", 1000))
-            except Exception:
-                return 1000
-        return 1000
-
-    def save_free_limit(self, new_limit):
-        try:
-            with open(self.CONFIG_FILE, "w") as f:
-                json.dump({"free_limit": new_limit}, f)
-            self.default_free_limit = new_limit
-        except Exception:
-            pass
-
-    def get_or_create_user(self, user_id, username=None):
-        user = self.db.get_user(user_id)
-        if not user:
-            self.db.add_user(user_id, username)
-            user = self.db.get_user(user_id)
-        return user
-
-    def get_user_stats(self, user_id):
-        stats = self.db.get_user_stats(user_id) or {}
-        # Provide defaults and logic for missing fields
-        stats.setdefault('is_owner', False)
-        stats.setdefault('is_vip', False)
-        stats.setdefault('message_count', 0)
-        # Set message limits and speed
-        if stats['is_owner'] or stats['is_vip']:
-            stats['message_limit'] = float('inf')
-            stats['remaining_messages'] = float('inf')
-            stats['speed_limit'] = 100.0  # or any high value for VIP/owner
-        else:
-            stats['message_limit'] = self.default_free_limit
-            stats['remaining_messages'] = stats['message_limit'] - stats['message_count']
-            stats['speed_limit'] = 2.0  # or your free user speed
-        return stats
-
-    def is_owner(self, user_id):
-        user = self.db.get_user(user_id)
-        return user.get('is_owner', False) if user else False
-
-    def can_send_messages(self, user_id):
-        stats = self.get_user_stats(user_id)
-        if stats['is_owner'] or stats['is_vip']:
-            return True
-        if not (stats['is_owner'] or stats['is_vip']) and stats['message_count'] >= stats['message_limit']:
-            # Optionally, trigger a notification or log here
-            return False
-        return True
-
-    def increment_message_count(self, user_id, count=1):
-        for _ in range(count):
-            self.db.increment_message_count(user_id)
-
-    def promote_to_vip(self, user_id):
-        """Promote a user to VIP status."""
-        try:
-            self.db.set_vip_status(user_id, True)
-            return True
-        except Exception as e:
-            return False
-
-    def demote_from_vip(self, user_id):
-        """Remove VIP status from a user."""
-        try:
-            self.db.set_vip_status(user_id, False)
-            return True
-        except Exception as e:
-            return False
-
-    # Add your user management methods here
+from database import DatabaseManager
+from config import USER_STATS_CACHE_TTL, ADMIN_STATS_CACHE_TTL, VIP_MESSAGE_LIMIT
+import asyncio
+import json
+import os
+import time
+
+class UserManager:
+    CONFIG_FILE = "free_user_limit.json"
+
+    def __init__(self):
+        self.db = DatabaseManager()
+        self.default_free_limit = self.load_free_limit()
+        # user_id -> (timestamp, stats) for short-lived reuse of get_user_stats results
+        self._stats_cache = {}
+        # (timestamp, counts) for the admin user totals; dropped whenever users or VIPs change
+        self._counts_cache = None
+        # Worker-thread query shared by concurrent get_user_counts_async callers
+        self._counts_inflight = None
+
+    def invalidate_user_cache(self, user_id=None):
+        """Drop cached stats for one user, or for everyone if user_id is None."""
+        if user_id is None:
+            self._stats_cache.clear()
+        else:
+            self._stats_cache.pop(user_id, None)
+
+    def get_user_counts(self):
+        """Total/VIP/owner counts, reused for ADMIN_STATS_CACHE_TTL seconds."""
+        cached = self._counts_cache
+        if cached and time.monotonic() - cached[0] < ADMIN_STATS_CACHE_TTL:
+            return cached[1]
+        counts = self.db.get_user_counts()
+        self._counts_cache = (time.monotonic(), counts)
+        return counts
+
+    async def get_user_counts_async(self):
+        """Like get_user_counts, but a cache miss queries from a worker thread."""
+        cached = self._counts_cache
+        if cached and time.monotonic() - cached[0] < ADMIN_STATS_CACHE_TTL:
+            return cached[1]
+        if self._counts_inflight is None:
+            self._counts_inflight = asyncio.ensure_future(asyncio.to_thread(self.get_user_counts))
+            self._counts_inflight.add_done_callback(self._clear_counts_inflight)
+        return await asyncio.shield(self._counts_inflight)
+
+    def _clear_counts_inflight(self, future):
+        if self._counts_inflight is future:
+            self._counts_inflight = None
+
+    def load_free_limit(self):
+        if os.path.exists(self.CONFIG_FILE):
+            try:
+                with open(self.CONFIG_FILE, "r") as f:
+                    data = json.load(f)
+                    return int(data.get("free_limit", 1000))
+            except Exception:
+                return 1000
+        return 1000
+
+    def save_free_limit(self, new_limit):
+        try:
+            with open(self.CONFIG_FILE, "w") as f:
+                json.dump({"free_limit": new_limit}, f)
+            self.default_free_limit = new_limit
+            self.invalidate_user_cache()
+        except Exception:
+            pass
+
+    def get_or_create_user(self, user_id, username=None):
+        user = self.db.get_user(user_id)
+        if not user:
+            self.db.add_user(user_id, username)
+            self.invalidate_user_cache(user_id)
+            self._counts_cache = None
+            user = self.db.get_user(user_id)
+        return user
+
+    def get_user_stats(self, user_id):
+        cached = self._stats_cache.get(user_id)
+        if cached and time.monotonic() - cached[0] < USER_STATS_CACHE_TTL:
+            return dict(cached[1])
+        stats = self.db.get_user_stats(user_id) or {}
+        # Provide defaults and logic for missing fields
+        stats.setdefault('is_owner', False)
+        stats.setdefault('is_vip', False)
+        stats.setdefault('message_count', 0)
+        # Set message limits and speed
+        if stats['is_owner'] or stats['is_vip']:
+            stats['message_limit'] = VIP_MESSAGE_LIMIT
+            stats['remaining_messages'] = None
+            stats['speed_limit'] = 100.0  # or any high value for VIP/owner
+        else:
+            stats['message_limit'] = self.default_free_limit
+            stats['remaining_messages'] = stats['message_limit'] - stats['message_count']
+            stats['speed_limit'] = 2.0  # or your free user speed
+        self._stats_cache[user_id] = (time.monotonic(), stats)
+        return dict(stats)
+
+    def is_owner(self, user_id):
+        return bool(self.get_user_stats(user_id)['is_owner'])
+
+    def can_send_messages(self, user_id):
+        stats = self.get_user_stats(user_id)
+        limit = stats['message_limit']
+        if limit is not None and stats['message_count'] >= limit:
+            # Optionally, trigger a notification or log here
+            return False
+        return True
+
+    def increment_message_count(self, user_id, count=1):
+        self.db.increment_message_count(user_id, count)
+        self.invalidate_user_cache(user_id)
+
+    def flush_message_counts(self):
+        """Write buffered message count increments to the database now."""
+        self.db.flush_message_counts()
+
+    def promote_to_vip(self, user_id):
+        """Promote a user to VIP status."""
+        try:
+            self.db.set_vip_status(user_id, True)
+            self.invalidate_user_cache(user_id)
+            self._counts_cache = None
+            return True
+        except Exception as e:
+            return False
+
+    def demote_from_vip(self, user_id):
+        """Remove VIP status from a user."""
+        try:
+            self.db.set_vip_status(user_id, False)
+            self.invalidate_user_cache(user_id)
+            self._counts_cache = None
+            return True
+        except Exception as e:
+            return False
+
+    # Add your user management methods here
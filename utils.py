@@ -1,10 +1,18 @@
 
 import re
+import time
+import asyncio
 import logging
 from typing import Tuple, Optional
+from pyrogram.errors import FloodWait
 
 logger = logging.getLogger(__name__)
 
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# References to fire-and-forget tasks, so they aren't garbage collected mid-run
+_background_tasks = set()
+
 def validate_phone_number(phone: str) -> Tuple[bool, str]:
     """Validate phone number format"""
     phone = phone.strip().replace(" ", "").replace("-", "")
@@ -79,7 +87,7 @@ def clean_text(text: str) -> str:
     
     # Remove or replace problematic characters
     text = text.replace('\n', ' ').replace('\r', ' ')
-    text = re.sub(r'\s+', ' ', text)  # Replace multiple spaces with single space
+    text = _WHITESPACE_RE.sub(' ', text)  # Replace multiple spaces with single space
     text = text.strip()
     
     # Limit length
@@ -87,3 +95,74 @@ def clean_text(text: str) -> str:
         text = text[:97] + "..."
     
     return text
+
+class RateLimiter:
+    """Async token bucket allowing `rate` calls per `per` seconds"""
+
+    def __init__(self, rate: int, per: float = 1.0):
+        self.rate = rate
+        self.per = per
+        self._tokens = float(rate)
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a call is allowed"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate / self.per)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) * self.per / self.rate)
+
+    def is_idle(self) -> bool:
+        """Whether the bucket has been unused long enough to be full again"""
+        return time.monotonic() - self._updated >= self.per
+
+class ThrottledEditor:
+    """Best-effort status edits of one message: at most one per `interval` seconds,
+    repeated texts skipped, and none at all while Telegram has us in a FloodWait"""
+
+    def __init__(self, message, interval: float):
+        self.message = message
+        self.interval = interval
+        self._next_edit = 0.0
+        self._last_text = None
+
+    async def __call__(self, text: str):
+        now = time.monotonic()
+        if self.message is None or now < self._next_edit or text == self._last_text:
+            return
+        self._next_edit = now + self.interval
+        self._last_text = text
+        try:
+            await self.message.edit_text(text)
+        except FloodWait as e:
+            self._next_edit = time.monotonic() + e.value
+        except Exception:
+            pass
+
+def answer_in_background(callback_query):
+    """Acknowledge a button press without waiting on it; a failed answer (e.g. a stale query) is only logged"""
+    task = asyncio.create_task(callback_query.answer())
+    _background_tasks.add(task)
+    task.add_done_callback(_answer_done)
+
+def _answer_done(task: asyncio.Task):
+    _background_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not answer callback query: {task.exception()}")
+
+async def retry_flood_wait(func, *args, attempts: int = 3, **kwargs):
+    """Await func(*args, **kwargs), sleeping out FloodWait and retrying up to `attempts` times in total"""
+    for attempt in range(1, attempts + 1):
+        try:
+            return await func(*args, **kwargs)
+        except FloodWait as e:
+            if attempt == attempts:
+                raise
+            logger.warning(f"FloodWait on {getattr(func, '__name__', func)}, sleeping {e.value}s")
+            await asyncio.sleep(e.value)